@@ -1,11 +1,12 @@
 from pathlib import Path
-from app.config import default_config
+from app.config import load_config
 from app.web import create_app
+from app.server import serve
 
 def main():
-    cfg = default_config(Path(__file__).resolve().parent)
+    cfg = load_config(Path(__file__).resolve().parent / "config.json")
     app = create_app(cfg)
-    app.run(host=cfg.host, port=cfg.port, debug=False, threaded=True)
+    serve(app, cfg).wait()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,142 @@
+from __future__ import annotations
+from dataclasses import asdict, replace
+from pathlib import Path
+from typing import List
+import argparse
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from .config import load_config
+from .storage import list_notes
+from .indexer import Index, build_index_from_chunks, index_disk_bytes, load_index, note_vectors, save_index, search_many
+from .worker import load_corpus
+
+# Try a grid of index shapes on the real vault and pick the most accurate
+# one that fits a query latency and memory budget:
+#   python -m app.autotune --latency-ms 50 --memory-mb 256 [--write]
+# Chunking comes from config.json and stays fixed, so every candidate indexes
+# the same rows and its top-10 can be compared with the largest shape's.
+
+def _ints(s: str) -> List[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+def _vault_queries(idx: Index, rnd: random.Random, n: int) -> List[str]:
+    # short word runs lifted from random chunks, so queries look like the vault
+    out = []
+    for _ in range(n):
+        words = idx.chunks.texts[rnd.randrange(len(idx.chunks))].split()
+        if not words:
+            continue
+        k = rnd.randint(1, min(4, len(words)))
+        i = rnd.randrange(len(words) - k + 1)
+        out.append(" ".join(words[i:i + k]))
+    return out or ["note"]
+
+def _resident_bytes(idx: Index) -> int:
+    vocab = idx.vectorizer.vocabulary_
+    vocab_bytes = sum(sys.getsizeof(t) for t in vocab) + 104 * len(vocab)  # str objects + dict/int slots
+    return int(idx.matrix.nbytes + note_vectors(idx).centroids.nbytes + 2 * idx.lsa.components.nbytes
+               + idx.vectorizer.idf_.nbytes + vocab_bytes)
+
+def _rows(hits) -> List[str]:
+    return [c.chunk_id for c, _ in hits]
+
+def tune(cfg, dims: List[int], features: List[int], ngrams: List[int], dtypes: List[str],
+         latency_ms: float, memory_mb: float, queries: int = 200, seed: int = 0) -> dict:
+    paths = list(list_notes(cfg.notes_dir))
+    base = cfg.index_profile()
+    chunks = load_corpus(paths, cfg.index_workers, cfg.index_pool, base)
+    if not chunks:
+        raise SystemExit("no notes to tune on")
+    per_note = cfg.search_per_note or None
+    workdir = Path(tempfile.mkdtemp(prefix="ffn-tune-"))
+    candidates = []
+    reference = None
+    qs: List[str] = []
+    try:
+        shapes = sorted(((d, f, g) for d in dims for f in features for g in ngrams), reverse=True)
+        for d, f, g in shapes:
+            profile = replace(base, svd_dims=d, max_features=f, ngram_max=g, dtype="float32")
+            t0 = time.perf_counter()
+            built = build_index_from_chunks(chunks, profile=profile)
+            build_s = time.perf_counter() - t0
+            if not qs:
+                qs = _vault_queries(built, random.Random(seed), queries)
+            for dtype in dtypes:
+                idx = built if dtype == "float32" else replace(built, matrix=built.matrix.astype(dtype), notes=None,
+                                                               profile=replace(profile, dtype=dtype))
+                path = workdir / f"{d}-{f}-{g}-{dtype}"
+                save_index(idx, path)
+                loaded = load_index(path)
+                search_many(loaded, qs[:5], 10, per_note=per_note)  # first-touch costs
+                lat = []
+                results = []
+                for q in qs:
+                    t1 = time.perf_counter()
+                    results.append(_rows(search_many(loaded, [q], 10, per_note=per_note)[0]))
+                    lat.append(time.perf_counter() - t1)
+                lat.sort()
+                if reference is None:
+                    reference = results  # largest shape, float32
+                overlap = [len(set(a) & set(b)) / len(b) for a, b in zip(results, reference) if b]
+                candidates.append({
+                    "settings": {"index_svd_dims": d, "index_max_features": f, "index_ngram_max": g,
+                                 "index_dtype": dtype},
+                    "effective_dims": int(loaded.lsa.components.shape[0]),  # capped by vocabulary/rows
+                    "build_s": round(build_s, 3),
+                    "disk_mb": round(index_disk_bytes(path) / 2**20, 2),
+                    "memory_mb": round(_resident_bytes(loaded) / 2**20, 2),
+                    "p50_ms": round(lat[len(lat) // 2] * 1000, 3),
+                    "p95_ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000, 3),
+                    "recall@10": round(sum(overlap) / len(overlap), 4) if overlap else 1.0,
+                })
+                shutil.rmtree(path, ignore_errors=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for c in candidates:
+        c["fits"] = c["p95_ms"] <= latency_ms and c["memory_mb"] <= memory_mb
+    fitting = [c for c in candidates if c["fits"]]
+    if fitting:
+        best = max(fitting, key=lambda c: (c["recall@10"], -c["memory_mb"], -c["p95_ms"]))
+    else:  # nothing fits: the cheapest shape is the closest we can get
+        best = min(candidates, key=lambda c: (c["memory_mb"] / memory_mb + c["p95_ms"] / latency_ms))
+    return {"notes": len(paths), "chunks": len(chunks), "queries": len(qs),
+            "budget": {"latency_ms": latency_ms, "memory_mb": memory_mb},
+            "chunking": {k: v for k, v in asdict(base).items() if k.startswith("chunk_")},
+            "chosen": best["settings"], "chosen_fits": best["fits"], "candidates": candidates}
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m app.autotune",
+                                 description="Pick index shape settings that fit a latency/memory budget.")
+    ap.add_argument("--config", type=Path, default=Path(__file__).resolve().parents[1] / "config.json")
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="p95 single-query search budget")
+    ap.add_argument("--memory-mb", type=float, default=256.0, help="resident index memory budget")
+    ap.add_argument("--dims", default="64,128,256", help="SVD dimensions to try")
+    ap.add_argument("--features", default="20000,50000", help="TF-IDF vocabulary sizes to try")
+    ap.add_argument("--ngrams", default="1,2", help="max n-gram lengths to try")
+    ap.add_argument("--dtypes", default="float32,float16", help="matrix dtypes to try")
+    ap.add_argument("--queries", type=int, default=200, help="queries sampled from the vault per candidate")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--write", action="store_true", help="store the chosen settings in the config file")
+    args = ap.parse_args(argv)
+
+    cfg = load_config(args.config)
+    print(f"tuning on {cfg.notes_dir}…", file=sys.stderr)
+    report = tune(cfg, _ints(args.dims), _ints(args.features), _ints(args.ngrams),
+                  [d for d in args.dtypes.split(",") if d.strip()], args.latency_ms, args.memory_mb,
+                  args.queries, args.seed)
+    print(json.dumps(report, indent=2))
+    if args.write:
+        raw = json.loads(args.config.read_text(encoding="utf-8")) if args.config.exists() else {}
+        raw.update(report["chosen"])
+        args.config.write_text(json.dumps(raw, indent=2) + "\n", encoding="utf-8")
+        print(f"wrote {', '.join(report['chosen'])} to {args.config}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,167 @@
+from __future__ import annotations
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from .config import default_config
+from .storage import NoteMeta, _render, _safe_title_to_slug
+from .indexer import save_index, load_index, search, build_ivf, ann_recall
+from .worker import build_full
+
+# Synthetic vault generator + timing harness. Run with
+#   python -m app.bench --sizes 1000,10000,100000 --out bench.json
+# and diff the JSON between runs to spot regressions.
+
+WORDS = (
+    "meeting project budget release deploy server client database migration review design "
+    "roadmap customer invoice backlog sprint standup retro bug fix refactor latency cache "
+    "index search query note idea todo follow up email call vendor contract hiring interview "
+    "onboarding laptop password vpn network printer outage incident postmortem dashboard "
+    "metric report quarter goal plan draft feedback lunch coffee travel flight hotel train "
+    "doctor dentist gym groceries birthday gift book podcast article python flask sqlite "
+    "kubernetes docker terraform backup restore upgrade license renewal"
+).split()
+TASK_VERBS = ["email", "call", "review", "fix", "write", "book", "pay", "check", "update", "ship"]
+
+def _sentence(rnd: random.Random) -> str:
+    words = [rnd.choice(WORDS) for _ in range(rnd.randint(6, 18))]
+    return " ".join(words).capitalize() + "."
+
+def _body(rnd: random.Random) -> str:
+    blocks: List[str] = []
+    for _ in range(rnd.randint(1, 6)):
+        blocks.append(" ".join(_sentence(rnd) for _ in range(rnd.randint(1, 6))))
+        if rnd.random() < 0.35:
+            lines = []
+            for _ in range(rnd.randint(1, 3)):
+                mark = "***" if rnd.random() < 0.4 else "**"
+                lines.append(f"{mark} {rnd.choice(TASK_VERBS)} {rnd.choice(WORDS)} {rnd.choice(WORDS)}")
+                for _ in range(rnd.randint(0, 2)):
+                    lines.append(f"{rnd.choice('@!')} {_sentence(rnd)}")
+            blocks.append("\n".join(lines))
+    return "\n\n".join(blocks) + "\n"
+
+def generate_vault(notes_dir: Path, n: int, seed: int = 0, days: int = 3 * 365) -> None:
+    rnd = random.Random(seed)
+    end = datetime.now().replace(microsecond=0)
+    for i in range(n):
+        created = end - timedelta(seconds=rnd.randint(0, days * 86400))
+        stamp = created.isoformat()
+        folder = notes_dir / stamp[:4] / stamp[:7]
+        folder.mkdir(parents=True, exist_ok=True)
+        title = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 5))).capitalize()
+        note_id = f"{seed:02x}{i:08x}"
+        meta = NoteMeta(note_id=note_id, title=title, created=stamp, updated=stamp)
+        path = folder / f"{stamp.replace(':','-')}_{_safe_title_to_slug(title)}_{note_id}.md"
+        path.write_text(_render(meta, _body(rnd)), encoding="utf-8")
+        ts = created.timestamp()
+        os.utime(path, (ts, ts))
+
+def _timed(fn, repeat: int = 1) -> dict:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return {
+        "n": repeat,
+        "min_s": round(samples[0], 6),
+        "median_s": round(statistics.median(samples), 6),
+        "p95_s": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 6),
+    }
+
+def _queries(rnd: random.Random, n: int) -> List[str]:
+    return [" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 4))) for _ in range(n)]
+
+def bench_size(n_notes: int, workdir: Path, repeat: int = 20, seed: int = 0, ann_probes: int = 0) -> dict:
+    base = workdir / f"vault-{n_notes}"
+    shutil.rmtree(base, ignore_errors=True)
+    cfg = default_config(base)
+    cfg.watch_notes = False
+    out: dict = {"notes": n_notes, "timings": {}}
+    t = out["timings"]
+    t["generate"] = _timed(lambda: generate_vault(cfg.notes_dir, n_notes, seed))
+
+    box = {}
+    t["build_index"] = _timed(lambda: box.update(idx=build_full(cfg)))
+    idx = box["idx"]
+    out["chunks"] = len(idx.chunks)
+    out["build_phases"] = idx.stats
+    t["save_index"] = _timed(lambda: save_index(idx, cfg.index_path))
+    out["index_bytes"] = sum(p.stat().st_size for p in cfg.index_path.rglob("*") if p.is_file())
+    t["load_index"] = _timed(lambda: box.update(loaded=load_index(cfg.index_path)), repeat=3)
+
+    rnd = random.Random(seed + 1)
+    qs = iter(_queries(rnd, repeat * 8))
+    t["search"] = _timed(lambda: search(idx, next(qs), top_k=12), repeat=repeat)
+    if ann_probes:
+        t["build_ivf"] = _timed(lambda: setattr(idx, "ivf", build_ivf(idx.matrix)))
+        t["search_ann"] = _timed(lambda: search(idx, next(qs), top_k=12, probes=ann_probes), repeat=repeat)
+        qvecs = idx.lsa.transform(idx.vectorizer.transform(_queries(rnd, 100)))
+        out["ann"] = {"probes": ann_probes, "lists": len(idx.ivf.centroids),
+                      "recall@10": round(ann_recall(idx, qvecs, 10, ann_probes), 4)}
+        idx.ivf = None
+
+    from .web import create_app  # flask is only needed for the route timings
+    app = create_app(cfg)
+    app.extensions["index_worker"].wait_idle()
+    app.extensions["catalog"].ready.wait()
+    client = app.test_client()
+
+    def get(url: str):
+        r = client.get(url)
+        assert r.status_code == 200, (url, r.status_code)
+
+    t["route_browse"] = _timed(lambda: get("/browse"), repeat=repeat)
+    t["route_browse_filter"] = _timed(lambda: get(f"/browse?q={next(qs).split()[0]}"), repeat=repeat)
+    t["route_tasks"] = _timed(lambda: get("/tasks"), repeat=repeat)
+    t["route_search"] = _timed(lambda: get(f"/search?q={next(qs)}"), repeat=repeat)
+    t["route_copilot"] = _timed(lambda: get(f"/copilot?q={next(qs)}&k=10"), repeat=repeat)
+    return out
+
+def main(argv: List[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m app.bench", description="Benchmark index build, search and routes.")
+    ap.add_argument("--sizes", default="1000,10000", help="comma separated note counts (e.g. 1000,10000,100000)")
+    ap.add_argument("--repeat", type=int, default=20, help="samples per timed operation")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--ann-probes", type=int, default=0, help="also time IVF search with this many probes")
+    ap.add_argument("--workdir", type=Path, default=None, help="where to generate vaults (default: temp dir)")
+    ap.add_argument("--keep", action="store_true", help="keep generated vaults")
+    ap.add_argument("--out", type=Path, default=None, help="write JSON here instead of stdout")
+    args = ap.parse_args(argv)
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="ffn-bench-"))
+    report = {
+        "started": datetime.now().replace(microsecond=0).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "runs": [],
+    }
+    try:
+        for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+            print(f"benchmarking {size} notes…", file=sys.stderr)
+            report["runs"].append(bench_size(size, workdir, args.repeat, args.seed, args.ann_probes))
+    finally:
+        if not args.keep and args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        args.out.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,104 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+import threading
+
+from .indexer import Chunk, Index, embed_queries, search_vectors
+
+_MISSING = object()
+
+class LRUCache:
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {"entries": len(self._data), "max_entries": self.max_entries, "hits": self.hits,
+                    "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else None}
+
+def normalize_query(q: str) -> str:
+    return " ".join((q or "").lower().split())
+
+# Caches projected query vectors and ranked hits per index generation. Any
+# rebuild or incremental update publishes a new generation; it is part of
+# every key, so entries of older snapshots are never served and simply age
+# out of the LRU, while requests still holding an older snapshot during a
+# publish keep their own entries instead of clearing the cache.
+class QueryCache:
+    def __init__(self, max_results: int = 512, max_vectors: int = 2048):
+        self.results = LRUCache(max_results)
+        self.vectors = LRUCache(max_vectors)
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _note_generation(self, idx: Index) -> None:
+        with self._lock:
+            if self._generation is None or idx.generation > self._generation:
+                self._generation = idx.generation
+
+    def search(self, idx: Index, queries: List[str], top_k: int = 10, probes: Optional[int] = None,
+               date_from: Optional[str] = None, date_to: Optional[str] = None,
+               per_note: Optional[int] = None) -> List[List[Tuple[Chunk, float]]]:
+        self._note_generation(idx)
+        qs = [normalize_query(q) for q in queries]
+        out: List[Optional[list]] = []
+        missing: List[int] = []
+        for i, q in enumerate(qs):
+            if not q:
+                out.append([])
+                continue
+            hit = self.results.get((q, top_k, probes, date_from, date_to, per_note, idx.generation))
+            out.append(hit)
+            if hit is None:
+                missing.append(i)
+        if not missing:
+            return out
+
+        vecs: dict = {}
+        need = []
+        for i in missing:
+            v = self.vectors.get((qs[i], idx.generation))
+            if v is None:
+                need.append(qs[i])
+            else:
+                vecs[qs[i]] = v
+        if need:
+            need = list(dict.fromkeys(need))
+            for q, v in zip(need, embed_queries(idx, need)):
+                vecs[q] = v
+                self.vectors.put((q, idx.generation), v)
+
+        hits = search_vectors(idx, [vecs[qs[i]] for i in missing], top_k, probes, date_from, date_to, per_note)
+        for i, h in zip(missing, hits):
+            out[i] = h
+            self.results.put((qs[i], top_k, probes, date_from, date_to, per_note, idx.generation), h)
+        return out
+
+    def stats(self) -> dict:
+        return {"generation": self._generation, "results": self.results.stats(), "vectors": self.vectors.stats()}
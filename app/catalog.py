@@ -0,0 +1,292 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+
+from .storage import load_note
+from .tasks import extract_tasks, TaskItem, TaskNote
+
+# Bump when the schema changes; the catalog is derived data and is simply
+# rebuilt from the notes on a mismatch.
+CATALOG_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    note_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    created TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha1 TEXT NOT NULL,
+    snippet TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_mtime ON notes(mtime);
+CREATE TABLE IF NOT EXISTS grams (
+    gram TEXT NOT NULL,
+    note INTEGER NOT NULL,
+    PRIMARY KEY (gram, note)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tokens (
+    token TEXT NOT NULL,
+    note INTEGER NOT NULL,
+    PRIMARY KEY (token, note)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS grams_note ON grams(note);
+CREATE INDEX IF NOT EXISTS tokens_note ON tokens(note);
+CREATE TABLE IF NOT EXISTS tasks (
+    note INTEGER NOT NULL,
+    line_no INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    done INTEGER NOT NULL,
+    status TEXT,
+    notes TEXT NOT NULL,
+    PRIMARY KEY (note, line_no)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks(done, status);
+"""
+
+TASK_FILTERS = {
+    "all": "",
+    "not_completed": "WHERE t.done = 0",
+    "completed": "WHERE t.done = 1",
+    "created": "WHERE t.done = 0 AND t.status = 'created'",
+    "in_progress": "WHERE t.done = 0 AND t.status = 'in_progress'",
+}
+
+TOKEN_RE = re.compile(r"\w+")
+WORD_RE = re.compile(r"\w+\Z")
+
+def _lexical_text(title: str, body: str) -> str:
+    return (title + "\n" + body).lower()
+
+def trigrams(text: str) -> set:
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+def _snippet(body: str) -> str:
+    s = body.strip()
+    first = s.splitlines()[0] if s else ""
+    return first[:160] + ("…" if len(first) > 160 else "")
+
+def scan_notes(notes_dir: Path) -> dict:
+    # path -> (mtime_ns, size) for every .md file under notes_dir
+    out = {}
+    stack = [str(notes_dir)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                elif e.name.endswith(".md"):
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    out[e.path] = (st.st_mtime_ns, st.st_size)
+    return out
+
+# SQLite catalog of note metadata so list views read one page of rows instead
+# of stat-ing and parsing every note. Also holds a lexical index (word tokens
+# and character trigrams -> note) used to narrow substring filters down to
+# candidate notes, and the tasks extracted from each note. Kept fresh by `refresh` on in-app writes and by `sync`,
+# which re-parses only files whose mtime/size changed.
+class Catalog:
+    def __init__(self, db_path: Path, notes_dir: Path):
+        self.notes_dir = notes_dir
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        self.ready = threading.Event()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            if self._db.execute("PRAGMA user_version").fetchone()[0] != CATALOG_VERSION:
+                for (name,) in self._db.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
+                    self._db.execute(f"DROP TABLE IF EXISTS {name}")
+                self._db.execute(f"PRAGMA user_version={CATALOG_VERSION}")
+            self._db.executescript(SCHEMA)
+
+    def _note_rowid(self, path: str) -> Optional[int]:
+        r = self._db.execute("SELECT id FROM notes WHERE path = ?", (path,)).fetchone()
+        return r[0] if r else None
+
+    def _clear_derived(self, rowid: int) -> None:
+        for table in ("grams", "tokens", "tasks"):
+            self._db.execute(f"DELETE FROM {table} WHERE note = ?", (rowid,))
+
+    def _upsert(self, p: Path, mtime: int, size: int) -> bool:
+        sha1 = hashlib.sha1(p.read_bytes()).hexdigest()
+        r = self._db.execute("SELECT id, sha1 FROM notes WHERE path = ?", (str(p),)).fetchone()
+        if r and r["sha1"] == sha1:
+            # touched but unchanged (e.g. git checkout): keep derived rows
+            self._db.execute("UPDATE notes SET mtime = ?, size = ? WHERE id = ?", (mtime, size, r["id"]))
+            return False
+        n = load_note(p)
+        self._db.execute(
+            "INSERT INTO notes(path, note_id, title, created, updated, mtime, size, sha1, snippet) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET "
+            "note_id=excluded.note_id, title=excluded.title, created=excluded.created, updated=excluded.updated, "
+            "mtime=excluded.mtime, size=excluded.size, sha1=excluded.sha1, snippet=excluded.snippet",
+            (str(p), n.meta.note_id, n.meta.title, n.meta.created, n.meta.updated, mtime, size, sha1,
+             _snippet(n.body)))
+        rowid = self._note_rowid(str(p))
+        self._clear_derived(rowid)
+        text = _lexical_text(n.meta.title, n.body)
+        self._db.executemany("INSERT INTO grams(gram, note) VALUES (?, ?)", ((g, rowid) for g in trigrams(text)))
+        self._db.executemany("INSERT INTO tokens(token, note) VALUES (?, ?)",
+                             ((t, rowid) for t in set(TOKEN_RE.findall(text))))
+        self._db.executemany(
+            "INSERT OR REPLACE INTO tasks(note, line_no, text, done, status, notes) VALUES (?, ?, ?, ?, ?, ?)",
+            ((rowid, line_no, txt, int(done), status, json.dumps([[tn.line_no, tn.prefix, tn.text] for tn in notes]))
+             for line_no, txt, done, status, notes in extract_tasks(n.body)))
+        return True
+
+    def _delete(self, path: str) -> bool:
+        rowid = self._note_rowid(path)
+        if rowid is None:
+            return False
+        self._clear_derived(rowid)
+        self._db.execute("DELETE FROM notes WHERE id = ?", (rowid,))
+        return True
+
+    def sync(self) -> Tuple[List[Path], List[Path]]:
+        # ready is set even if the sync fails, so readers waiting on it never hang
+        try:
+            on_disk = scan_notes(self.notes_dir)
+            with self._lock:
+                known = {r["path"]: (r["mtime"], r["size"])
+                         for r in self._db.execute("SELECT path, mtime, size FROM notes")}
+                stale = [p for p, stamp in on_disk.items() if known.get(p) != stamp]
+                removed = [p for p in known if p not in on_disk]
+                changed = []
+                with self._db:
+                    for p in stale:
+                        try:
+                            if self._upsert(Path(p), *on_disk[p]):
+                                changed.append(p)
+                        except OSError:
+                            # gone since the scan, or not a readable file (a symlinked folder)
+                            if self._delete(p):
+                                removed.append(p)
+                    for p in removed:
+                        self._delete(p)
+        finally:
+            self.ready.set()
+        return [Path(p) for p in changed], [Path(p) for p in removed]
+
+    def refresh(self, paths: Iterable[Path]) -> List[Path]:
+        # returns the paths whose content actually changed (or went away)
+        changed = []
+        with self._lock, self._db:
+            for p in paths:
+                try:
+                    st = p.stat()
+                except OSError:
+                    if self._delete(str(p)):
+                        changed.append(p)
+                    continue
+                try:
+                    if self._upsert(p, st.st_mtime_ns, st.st_size):
+                        changed.append(p)
+                except OSError:
+                    if self._delete(str(p)):
+                        changed.append(p)
+        return changed
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def page(self, offset: int, limit: int) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path, title, created, updated, snippet FROM notes ORDER BY mtime DESC LIMIT ? OFFSET ?",
+                (limit, offset)).fetchall()
+        return [dict(r) for r in rows]
+
+    def iter_newest(self, batch: int = 500) -> Iterable[dict]:
+        offset = 0
+        while True:
+            rows = self.page(offset, batch)
+            yield from rows
+            if len(rows) < batch:
+                return
+            offset += batch
+
+    def candidates(self, q: str) -> Iterable[dict]:
+        # Notes (newest first) that may contain q in title or body: every
+        # trigram of q must be posted for the note, or for short queries one
+        # of its tokens must contain q. Callers still verify each candidate.
+        q = q.lower()
+        cols = "n.path, n.title, n.created, n.updated, n.snippet"
+        if len(q) >= 3:
+            grams = sorted(trigrams(q))
+            sql = (f"SELECT {cols} FROM notes n JOIN (SELECT note FROM grams WHERE gram IN "
+                   f"({','.join('?' * len(grams))}) GROUP BY note HAVING COUNT(*) = ?) c ON c.note = n.id "
+                   "ORDER BY n.mtime DESC")
+            args = [*grams, len(grams)]
+        elif WORD_RE.match(q):
+            sql = (f"SELECT {cols} FROM notes n WHERE n.id IN "
+                   "(SELECT note FROM tokens WHERE instr(token, ?) > 0) ORDER BY n.mtime DESC")
+            args = [q]
+        else:
+            return self.iter_newest()
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [dict(r) for r in rows]
+
+    def matching(self, q: str) -> Iterable[dict]:
+        q = q.lower()
+        for row in self.candidates(q):
+            if q in row["title"].lower():
+                yield row
+                continue
+            try:
+                body = load_note(Path(row["path"])).body
+            except OSError:
+                continue
+            if q in body.lower():
+                yield row
+
+    def tasks(self, status_filter: str = "not_completed") -> List[TaskItem]:
+        # oldest note first, then in line order
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT n.path, n.title, n.created, t.line_no, t.text, t.done, t.status, t.notes "
+                f"FROM tasks t JOIN notes n ON n.id = t.note {TASK_FILTERS[status_filter]} "
+                "ORDER BY n.mtime, t.line_no").fetchall()
+        return [TaskItem(note_path=Path(r["path"]), note_title=r["title"], note_created=r["created"],
+                         line_no=r["line_no"], text=r["text"], done=bool(r["done"]), status=r["status"],
+                         notes=[TaskNote(line_no=a, prefix=b, text=c) for a, b, c in json.loads(r["notes"])])
+                for r in rows]
+
+    def task_counts(self) -> dict:
+        counts = {k: 0 for k in TASK_FILTERS}
+        with self._lock:
+            rows = self._db.execute("SELECT done, status, COUNT(*) FROM tasks GROUP BY done, status").fetchall()
+        for done, status, n in rows:
+            counts["all"] += n
+            if done:
+                counts["completed"] += n
+            else:
+                counts["not_completed"] += n
+                if status in counts:
+                    counts[status] += n
+        return counts
+
+    def get(self, path: Path) -> Optional[dict]:
+        with self._lock:
+            r = self._db.execute("SELECT * FROM notes WHERE path = ?", (str(path),)).fetchone()
+        return dict(r) if r else None
@@ -1,18 +1,92 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from pathlib import Path
+from typing import Optional
+import json
+
+from .indexer import IndexProfile
 
 @dataclass
 class AppConfig:
     base_dir: Path
     notes_dir: Path
     index_path: Path
+    data_dir: Optional[Path] = None  # catalog, images, capture journal; defaults to base_dir/data
     host: str = "127.0.0.1"
     port: int = 17831
+    watch_notes: bool = True
+    watch_poll_seconds: float = 2.0
+    index_workers: int = 0          # 0 = one per CPU
+    index_pool: str = "thread"      # "thread" or "process"
+    index_memory_mb: int = 0        # >0: streaming full builds bounded by roughly this budget
+    ann: bool = False               # approximate (IVF + int8) search for large vaults
+    ann_probes: int = 16
+    ann_min_rows: int = 20000
+    search_per_note: int = 2        # max chunks per note in /search and /copilot (0 = no cap)
+    max_results: int = 12           # hits shown on /search
+    chunk_min_chars: int = 200
+    chunk_max_chars: int = 900
+    chunk_overlap_chars: int = 120
+    index_max_features: int = 50000
+    index_ngram_max: int = 2
+    index_svd_dims: int = 256
+    index_dtype: str = "float32"    # "float32" or "float16" (half the matrix size, slightly slower scans)
+    index_shard_by: str = "month"   # "month", "year" or "none": saves rewrite only the shards that changed
+    server: str = "waitress"        # "waitress" or "werkzeug" (pooled; also used when waitress is missing)
+    server_threads: int = 8
+    server_max_inflight: int = 64   # running + queued requests; beyond this 503 + Retry-After (min server_threads)
+    search_threads: int = 2         # CPU-bound search runs on its own small pool
+    search_queue: int = 16
+    drain_seconds: float = 10.0     # graceful shutdown: wait this long for in-flight requests
+    slow_request_ms: int = 500      # log requests slower than this (0 = off)
+    profile_requests: bool = False  # allow ?_profile=1 to return a sampled stack profile of that request
+
+    def __post_init__(self):
+        if self.data_dir is None:
+            self.data_dir = self.base_dir / "data"
+
+    def index_profile(self) -> IndexProfile:
+        return IndexProfile(chunk_min_chars=self.chunk_min_chars, chunk_max_chars=self.chunk_max_chars,
+                            chunk_overlap_chars=self.chunk_overlap_chars, max_features=self.index_max_features,
+                            ngram_max=self.index_ngram_max, svd_dims=self.index_svd_dims, dtype=self.index_dtype,
+                            shard_by=self.index_shard_by)
 
 def default_config(base_dir: Path) -> AppConfig:
     data = base_dir / "data"
     notes = data / "notes"
-    idx = data / "index.pkl"
+    idx = data / "index"
     notes.mkdir(parents=True, exist_ok=True)
     return AppConfig(base_dir=base_dir, notes_dir=notes, index_path=idx)
+
+PATH_KEYS = ("data_dir", "notes_dir", "index_path")
+
+def load_config(path: Path) -> AppConfig:
+    # config.json next to the app; relative paths are resolved against its
+    # folder and unknown keys are ignored. A missing file means defaults.
+    base_dir = path.resolve().parent
+    cfg = default_config(base_dir)
+    if not path.exists():
+        return cfg
+    raw = json.loads(path.read_text(encoding="utf-8"))
+    known = {f.name: f for f in fields(AppConfig)}
+    for key, value in raw.items():
+        if key not in known or key == "base_dir":
+            continue
+        if key in PATH_KEYS:
+            value = (base_dir / value).resolve()
+        elif isinstance(getattr(cfg, key), bool):
+            if not isinstance(value, bool):
+                raise ValueError(f"config.json: {key} must be true or false")
+        elif isinstance(getattr(cfg, key), (int, float)) and not isinstance(value, (int, float)):
+            raise ValueError(f"config.json: {key} must be a number")
+        setattr(cfg, key, value)
+    if "data_dir" in raw and "notes_dir" not in raw:
+        cfg.notes_dir = cfg.data_dir / "notes"
+    if "data_dir" in raw and "index_path" not in raw:
+        cfg.index_path = cfg.data_dir / "index"
+    if cfg.index_dtype not in ("float32", "float16"):
+        raise ValueError("config.json: index_dtype must be float32 or float16")
+    if cfg.index_shard_by not in ("month", "year", "none"):
+        raise ValueError("config.json: index_shard_by must be month, year or none")
+    cfg.notes_dir.mkdir(parents=True, exist_ok=True)
+    return cfg
@@ -0,0 +1,64 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+import gzip
+import os
+
+from flask import Flask, Response, request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+COMPRESS_TYPES = ("text/html", "text/css", "text/plain", "application/json", "application/javascript")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def file_etag(st: os.stat_result, *extra) -> str:
+    parts = [f"{st.st_mtime_ns:x}", f"{st.st_size:x}", *(str(x) for x in extra)]
+    return "-".join(parts)
+
+def file_last_modified(st: os.stat_result) -> datetime:
+    return datetime.fromtimestamp(int(st.st_mtime), tz=timezone.utc)
+
+def conditional(resp: Response, etag: str, last_modified: datetime) -> Response:
+    # Tag the response and turn it into a 304 if the client copy is current.
+    resp.set_etag(etag, weak=True)
+    resp.last_modified = last_modified
+    return resp.make_conditional(request)
+
+def not_modified(etag: str, last_modified: datetime) -> bool:
+    # Cheap pre-check so a revalidation can skip rendering entirely.
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    return since is not None and last_modified <= since
+
+def _pick_encoding() -> str:
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return ""
+
+def install_compression(app: Flask, min_size: int = 1024, gzip_level: int = 6) -> None:
+    @app.after_request
+    def _compress(resp: Response) -> Response:
+        if (resp.status_code != 200 or resp.direct_passthrough or resp.is_streamed
+                or "Content-Encoding" in resp.headers or resp.mimetype not in COMPRESS_TYPES):
+            return resp
+        resp.vary.add("Accept-Encoding")
+        data = resp.get_data()
+        enc = _pick_encoding() if len(data) >= min_size else ""
+        if not enc:
+            return resp
+        if enc == "br":
+            body = brotli.compress(data, quality=5)
+        else:
+            body = gzip.compress(data, compresslevel=gzip_level, mtime=0)
+        resp.set_data(body)
+        resp.headers["Content-Encoding"] = enc
+        etag, weak = resp.get_etag()
+        if etag and not weak:
+            resp.set_etag(etag, weak=True)  # the bytes differ per encoding
+        return resp
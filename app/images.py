@@ -0,0 +1,141 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import List, Optional, Tuple
+import hashlib
+import json
+import queue
+import re
+import threading
+
+THUMB_WIDTHS = (320, 640, 1280)
+NAME_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*\Z")
+
+# Pasted images are stored under the hash of their bytes, so pasting the
+# same screenshot twice reuses the first file. Downscaled WebP variants are
+# made by one background thread into thumbs/<stem>-<width>.webp, with a
+# thumbs/<stem>.json manifest recording the original width and which
+# variants exist. Manifests never change once written, so ready() (how many
+# of a page's images have one) is enough for callers caching rendered pages
+# to notice a new srcset. Names that are not a single plain file name in
+# images_dir (e.g. "../x.png" from a note's markdown) are never looked up.
+class ImageStore:
+    def __init__(self, images_dir: Path, widths: Tuple[int, ...] = THUMB_WIDTHS, quality: int = 80):
+        self.dir = images_dir
+        self.thumbs = images_dir / "thumbs"
+        self.widths = widths
+        self.quality = quality
+        self.generation = 0
+        self.deduped = 0
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._queued: set = set()
+        self._manifests: dict = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self.thumbs.mkdir(parents=True, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="image-thumbs", daemon=True)
+            self._thread.start()
+
+    def save(self, data: bytes, ext: str) -> Tuple[str, bool]:
+        # -> (filename, created); created is False for a duplicate upload
+        name = hashlib.sha256(data).hexdigest()[:32] + ext
+        path = self.dir / name
+        if path.exists():
+            with self._lock:
+                self.deduped += 1
+            return name, False
+        tmp = path.with_name(name + ".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+        self.enqueue(name)
+        return name, True
+
+    def valid_name(self, name: str) -> bool:
+        return bool(NAME_RE.match(name)) and (self.dir / name).resolve().parent == self.dir.resolve()
+
+    def enqueue(self, name: str) -> None:
+        if not self.valid_name(name):
+            return
+        with self._lock:
+            if name in self._queued:
+                return
+            self._queued.add(name)
+        self._queue.put(name)
+
+    def variants(self, name: str) -> Optional[dict]:
+        # Manifest for an image, or None while it is still being made (in
+        # which case it is queued, so images pasted before this existed get
+        # variants the first time a page shows them).
+        if not self.valid_name(name):
+            return None
+        with self._lock:
+            if name in self._manifests:
+                return self._manifests[name]
+        mf = self.thumbs / f"{Path(name).stem}.json"
+        try:
+            manifest = json.loads(mf.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            if (self.dir / name).is_file():
+                self.enqueue(name)
+            return None
+        with self._lock:
+            self._manifests[name] = manifest
+        return manifest
+
+    def srcset(self, name: str) -> Optional[str]:
+        m = self.variants(name)
+        if not m or not m.get("variants"):
+            return None
+        parts = [f"/images/thumbs/{v['file']} {v['width']}w" for v in m["variants"]]
+        parts.append(f"/images/{name} {m['width']}w")
+        return ", ".join(parts)
+
+    def ready(self, names) -> int:
+        # how many of these images have their variants made
+        return sum(1 for n in names if self.variants(n) is not None)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"queued": len(self._queued), "deduped": self.deduped, "generation": self.generation}
+
+    def _run(self) -> None:
+        while True:
+            name = self._queue.get()
+            try:
+                manifest = self._make_variants(name)
+            except Exception:
+                manifest = None
+            with self._lock:
+                self._queued.discard(name)
+                if manifest is not None:
+                    self._manifests[name] = manifest
+                    self.generation += 1
+
+    def _make_variants(self, name: str) -> Optional[dict]:
+        from PIL import Image
+
+        src = self.dir / name
+        if not self.valid_name(name) or not src.is_file():
+            return None
+        stem = Path(name).stem
+        variants: List[dict] = []
+        with Image.open(src) as im:
+            width, height = im.size
+            animated = getattr(im, "is_animated", False)
+            if not animated:
+                im = im.convert("RGBA" if im.mode in ("RGBA", "LA", "P") else "RGB")
+                for w in self.widths:
+                    if w >= width:
+                        break
+                    out = self.thumbs / f"{stem}-{w}.webp"
+                    if not out.exists():
+                        tmp = out.with_name(out.name + ".tmp")
+                        im.resize((w, max(1, round(height * w / width))), Image.LANCZOS).save(
+                            tmp, "WEBP", quality=self.quality, method=4)
+                        tmp.replace(out)
+                    variants.append({"file": out.name, "width": w})
+        manifest = {"width": width, "height": height, "variants": variants}
+        (self.thumbs / f"{stem}.json").write_text(json.dumps(manifest), encoding="utf-8")
+        return manifest
@@ -0,0 +1,229 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+import argparse
+import gzip
+import json
+import sys
+import tarfile
+import threading
+import time
+import uuid
+import zipfile
+
+from .config import load_config
+from .storage import (CREATED_KEYS, UPDATED_KEYS, Note, note_ids, plan_imported_markdown, plan_imported_note,
+                      write_note)
+
+# Bulk import of notes from other tools:
+#   python -m app.importer export.zip [vault/ notes.jsonl ...] [--batch 200]
+# A source is a folder of markdown files, a zip or tar(.gz) archive of them,
+# or JSON lines ({"title", "body", "created", "updated", "id"}, optionally
+# gzipped). Notes are written a batch at a time into the month folders of
+# their creation dates, and the search index is built once at the end
+# instead of once per note. Notes whose id is already in the vault (an
+# earlier import of the same note) are skipped.
+
+MARKDOWN_SUFFIXES = (".md", ".markdown", ".txt")
+
+def _is_markdown(name: str) -> bool:
+    name = name.replace("\\", "/")
+    base = name.rsplit("/", 1)[-1]
+    return base.lower().endswith(MARKDOWN_SUFFIXES) and not base.startswith(".") and "__MACOSX/" not in name
+
+def _guard(make: Callable[[], Note]) -> Union[Note, Exception]:
+    try:
+        return make()
+    except Exception as e:
+        return e
+
+def _from_record(notes_dir: Path, line: str) -> Note:
+    rec = json.loads(line)
+    if not isinstance(rec, dict):
+        raise ValueError("not a JSON object")
+    body = next((rec[k] for k in ("body", "content", "text") if k in rec), "")
+    if not isinstance(body, str):
+        raise ValueError("body must be a string")
+    created = next((rec[k] for k in CREATED_KEYS if rec.get(k) is not None), None)
+    updated = next((rec[k] for k in UPDATED_KEYS if rec.get(k) is not None), None)
+    return plan_imported_note(notes_dir, rec.get("title") or "", body, created, updated, rec.get("id"))
+
+def _decode(data: bytes) -> str:
+    return data.decode("utf-8", errors="replace")
+
+def iter_source(path: Path, notes_dir: Path) -> Iterator[Tuple[str, Union[Note, Exception]]]:
+    # -> (item label, planned note or the error that item raised)
+    if path.is_dir():
+        for p in sorted(path.rglob("*")):
+            if p.is_file() and _is_markdown(str(p.relative_to(path))):
+                yield str(p), _guard(lambda: plan_imported_markdown(notes_dir, _decode(p.read_bytes()), p.name,
+                                                                    p.stat().st_mtime))
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and _is_markdown(info.filename):
+                    mtime = time.mktime(info.date_time + (0, 0, -1))
+                    yield info.filename, _guard(lambda: plan_imported_markdown(
+                        notes_dir, _decode(zf.read(info)), info.filename, mtime))
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as tf:
+            for m in tf:  # streams members, the archive is never unpacked
+                if m.isfile() and _is_markdown(m.name):
+                    yield m.name, _guard(lambda: plan_imported_markdown(
+                        notes_dir, _decode(tf.extractfile(m).read()), m.name, m.mtime))
+    else:
+        with path.open("rb") as f:
+            gzipped = f.read(2) == b"\x1f\x8b"
+        opener = gzip.open if gzipped else open
+        with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+            for n, line in enumerate(f, 1):
+                if line.strip():
+                    yield f"line {n}", _guard(lambda: _from_record(notes_dir, line))
+
+def count_items(path: Path) -> Optional[int]:
+    # known up front for folders and zips; tar and JSON lines are streamed
+    if path.is_dir():
+        return sum(1 for p in path.rglob("*") if p.is_file() and _is_markdown(str(p.relative_to(path))))
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            return sum(1 for i in zf.infolist() if not i.is_dir() and _is_markdown(i.filename))
+    return None
+
+class ImportJob:
+    # One import source written `batch` notes at a time. on_batch gets the
+    # paths of each written batch (catalog refresh, index queue), on_done
+    # all written paths once writing has stopped, even after an error.
+    # status() can be polled from other threads while run() is going.
+    def __init__(self, source: Path, notes_dir: Path, batch: int = 200,
+                 on_batch: Optional[Callable[[List[Path]], None]] = None,
+                 on_done: Optional[Callable[[List[Path]], None]] = None, name: Optional[str] = None):
+        self.id = uuid.uuid4().hex[:10]
+        self.source = source
+        self.name = name or source.name
+        self.notes_dir = notes_dir
+        self.batch = max(1, batch)
+        self.on_batch = on_batch
+        self.on_done = on_done
+        self.paths: List[Path] = []
+        self._ids: set = set()
+        self.state = "queued"  # queued, importing, indexing, done, failed
+        self.total: Optional[int] = None
+        self.skipped = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors: List[str] = []  # the first few item errors
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def run(self) -> dict:
+        with self._lock:
+            self.state = "importing"
+            self.started_at = time.time()
+        ok = True
+        try:
+            self.total = count_items(self.source)
+            self._ids = note_ids(self.notes_dir)
+            pending: List[Note] = []
+            for label, item in iter_source(self.source, self.notes_dir):
+                if isinstance(item, Exception):
+                    self._error(label, item)
+                    continue
+                pending.append(item)
+                if len(pending) >= self.batch:
+                    self._write(pending)
+                    pending = []
+            self._write(pending)
+        except Exception as e:
+            ok = False
+            self._error(self.name, e)
+        finally:
+            with self._lock:
+                self.state = "indexing"
+            try:
+                if self.on_done is not None:
+                    self.on_done(list(self.paths))
+            finally:
+                with self._lock:
+                    self.state = "done" if ok else "failed"
+                    self.finished_at = time.time()
+        return self.status()
+
+    def _error(self, label: str, e: Exception) -> None:
+        with self._lock:
+            self.failed += 1
+            if len(self.errors) < 20:
+                self.errors.append(f"{label}: {type(e).__name__}: {e}")
+
+    def _write(self, notes: List[Note]) -> None:
+        written = []
+        for note in notes:
+            if note.meta.note_id in self._ids or note.path.exists():
+                with self._lock:
+                    self.skipped += 1
+                continue
+            try:
+                write_note(note)
+            except OSError as e:
+                self._error(str(note.path), e)
+                continue
+            written.append(note.path)
+            self._ids.add(note.meta.note_id)
+        with self._lock:
+            self.paths += written
+            self.batches += 1
+        if written and self.on_batch is not None:
+            self.on_batch(written)
+
+    def status(self) -> dict:
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {"id": self.id, "source": self.name, "state": self.state, "total": self.total,
+                    "processed": len(self.paths) + self.skipped + self.failed, "written": len(self.paths),
+                    "skipped": self.skipped, "failed": self.failed, "batches": self.batches,
+                    "errors": list(self.errors),
+                    "elapsed_s": round(end - self.started_at, 3) if self.started_at else 0.0}
+
+def main(argv: List[str] | None = None) -> int:
+    from .worker import rebuild_on_disk
+
+    ap = argparse.ArgumentParser(prog="python -m app.importer", description="Import notes from other tools in bulk.")
+    ap.add_argument("sources", nargs="+", type=Path,
+                    help="folder or .zip/.tar(.gz) of markdown files, or a .jsonl file")
+    ap.add_argument("--config", type=Path, default=Path(__file__).resolve().parents[1] / "config.json")
+    ap.add_argument("--batch", type=int, default=200, help="notes written between progress reports")
+    args = ap.parse_args(argv)
+
+    cfg = load_config(args.config)
+    written = failed = 0
+    for src in args.sources:
+        if not src.exists():
+            print(f"{src}: not found", file=sys.stderr)
+            failed += 1
+            continue
+        job = ImportJob(src, cfg.notes_dir, args.batch)
+
+        def progress(paths: List[Path], job: ImportJob = job) -> None:
+            st = job.status()
+            of = f"/{st['total']}" if st["total"] is not None else ""
+            print(f"{st['source']}: {st['processed']}{of} ({st['written']} written, {st['skipped']} skipped, "
+                  f"{st['failed']} failed)", file=sys.stderr)
+
+        job.on_batch = progress
+        st = job.run()
+        print(f"{src}: {st['written']} written, {st['skipped']} already imported, {st['failed']} failed "
+              f"in {st['elapsed_s']:.1f}s", file=sys.stderr)
+        for e in st["errors"]:
+            print(f"  {e}", file=sys.stderr)
+        written += st["written"]
+        failed += st["failed"]
+    if written:
+        print("building the search index…", file=sys.stderr)
+        t0 = time.perf_counter()
+        idx = rebuild_on_disk(cfg)
+        print(f"indexed {len(idx.chunks.note_paths)} notes ({len(idx.chunks)} chunks) in "
+              f"{time.perf_counter() - t0:.1f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,15 +1,75 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, field, replace
 from pathlib import Path
-from typing import List, Optional, Tuple
-import pickle
+from array import array
+from bisect import bisect_right
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+import importlib
+import json
+import mmap
+import os
+import random
 import re
+import shutil
+import threading
+import time
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.decomposition import TruncatedSVD
-from sklearn.preprocessing import Normalizer
-from sklearn.pipeline import make_pipeline
-import numpy as np
+from .metrics import METRICS
+
+if TYPE_CHECKING:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    import numpy as np
+
+class _LazyModule:
+    # Stands in for a module-level import until first use, then rebinds the
+    # global to the real module; keeps numpy/sklearn off the startup path.
+    def __init__(self, name: str, alias: str):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr: str):
+        mod = importlib.import_module(self._name)
+        globals()[self._alias] = mod
+        return getattr(mod, attr)
+
+if not TYPE_CHECKING:
+    np = _LazyModule("numpy", "np")
+
+def _sklearn_text():
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    return TfidfVectorizer
+
+INDEX_FORMAT = "fireforget-index"
+INDEX_VERSION = 2
+
+# How notes are cut into chunks and what shape the index has. Saved in the
+# index header; a change in config forces a full rebuild.
+@dataclass(frozen=True)
+class IndexProfile:
+    chunk_min_chars: int = 200      # shorter trailing pieces are merged into the previous chunk
+    chunk_max_chars: int = 900
+    chunk_overlap_chars: int = 120
+    max_features: int = 50000
+    ngram_max: int = 2              # TF-IDF n-grams 1..ngram_max
+    svd_dims: int = 256
+    dtype: str = "float32"          # LSA matrix storage: "float32" or "float16"
+    shard_by: str = "month"         # on-disk shards by note creation: "month", "year" or "none"
+
+    @classmethod
+    def from_dict(cls, d: Optional[dict]) -> "IndexProfile":
+        known = cls.__dataclass_fields__
+        return cls(**{k: v for k, v in (d or {}).items() if k in known})
+
+SHARD_WIDTH = {"month": 7, "year": 4}
+DATED_RE = re.compile(r"\d{4}(-\d{2}|$)")  # a created timestamp that starts with a year (and month)
+
+def shard_key(created: str, shard_by: str = "month") -> str:
+    # the shard of a note is the prefix of its ISO created timestamp
+    width = SHARD_WIDTH.get(shard_by)
+    if width is None:
+        return "all"
+    key = created[:width]
+    return key if DATED_RE.fullmatch(key) else "undated"
 
 @dataclass
 class Chunk:
@@ -19,14 +79,367 @@ class Chunk:
     text: str
     chunk_id: str
 
+class _Blob:
+    # read-only mmap of a <name>.bin string column plus its offsets
+    def __init__(self, d: Path, name: str):
+        self.offsets = np.load(d / f"{name}.off.npy")
+        with (d / f"{name}.bin").open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get(self, i: int) -> str:
+        return self.buf[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8")
+
+class TextColumn:
+    # Chunk texts without per-chunk objects: row i is either item ref[i] of
+    # the mmap'd blobs (ref >= 0, counted across the blobs in order; one blob
+    # per shard) or extra[-1 - ref[i]] for texts added since the index was
+    # loaded. take/append return new columns and share the blobs, so
+    # published snapshots are never mutated.
+    def __init__(self, blobs: List[_Blob], ref, extra: List[str]):
+        self.blobs = blobs
+        self.ref = ref
+        self.extra = extra
+        self._starts = [0]
+        for b in blobs:
+            self._starts.append(self._starts[-1] + len(b))
+
+    @classmethod
+    def from_list(cls, texts: List[str]) -> "TextColumn":
+        return cls([], -1 - np.arange(len(texts), dtype=np.int64), list(texts))
+
+    @classmethod
+    def from_blob(cls, blob: _Blob) -> "TextColumn":
+        return cls([blob], np.arange(len(blob), dtype=np.int64), [])
+
+    @classmethod
+    def concat(cls, cols: List["TextColumn"]) -> "TextColumn":
+        blobs: List[_Blob] = []
+        extra: List[str] = []
+        refs = [np.zeros(0, dtype=np.int64)]
+        for c in cols:
+            base = sum(len(b) for b in blobs)
+            refs.append(np.where(c.ref >= 0, c.ref + base, c.ref - len(extra)))
+            blobs += c.blobs
+            extra += c.extra
+        return cls(blobs, np.concatenate(refs), extra)
+
+    def __len__(self) -> int:
+        return len(self.ref)
+
+    def __getitem__(self, i: int) -> str:
+        r = int(self.ref[i])
+        if r < 0:
+            return self.extra[-1 - r]
+        b = bisect_right(self._starts, r) - 1
+        return self.blobs[b].get(r - self._starts[b])
+
+    def take(self, keep) -> "TextColumn":
+        return TextColumn(self.blobs, self.ref[keep], self.extra)
+
+    def append(self, texts: List[str]) -> "TextColumn":
+        start = len(self.extra)
+        ref = np.concatenate([self.ref, -1 - np.arange(start, start + len(texts), dtype=np.int64)])
+        return TextColumn(self.blobs, ref, self.extra + list(texts))
+
+class ChunkTable:
+    # Columnar chunk storage: each note's id/path/title/created is stored once
+    # and chunks are (note, ordinal) int32 columns plus a TextColumn. Chunk
+    # objects are only built for rows that are actually returned.
+    def __init__(self, note_ids: List[str], note_paths: List[str], note_titles: List[str],
+                 note_created: List[str], chunk_note, chunk_ord, texts: TextColumn):
+        self.note_ids = note_ids
+        self.note_paths = note_paths
+        self.note_titles = note_titles
+        self.note_created = note_created
+        self.chunk_note = np.asarray(chunk_note, dtype=np.int32)
+        self.chunk_ord = np.asarray(chunk_ord, dtype=np.int32)
+        self.texts = texts
+        self._by_path: Optional[dict] = None
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Chunk]) -> "ChunkTable":
+        t = cls([], [], [], [], np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), TextColumn.from_list([]))
+        return t.append(chunks)
+
+    @classmethod
+    def concat(cls, tables: List["ChunkTable"]) -> "ChunkTable":
+        ids: List[str] = []
+        paths: List[str] = []
+        titles: List[str] = []
+        created: List[str] = []
+        notes = [np.zeros(0, dtype=np.int32)]
+        for t in tables:
+            notes.append(t.chunk_note + len(paths))
+            ids += t.note_ids
+            paths += t.note_paths
+            titles += t.note_titles
+            created += t.note_created
+        return cls(ids, paths, titles, created, np.concatenate(notes),
+                   np.concatenate([np.zeros(0, dtype=np.int32)] + [t.chunk_ord for t in tables]),
+                   TextColumn.concat([t.texts for t in tables]))
+
+    def __len__(self) -> int:
+        return len(self.chunk_note)
+
+    def __getitem__(self, i: int) -> Chunk:
+        j = int(self.chunk_note[i])
+        return Chunk(note_path=self.note_paths[j], note_title=self.note_titles[j],
+                     note_created=self.note_created[j], text=self.texts[i],
+                     chunk_id=f"{self.note_ids[j]}:{int(self.chunk_ord[i])}")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def note_index(self, path: str) -> Optional[int]:
+        if self._by_path is None:
+            self._by_path = {p: j for j, p in enumerate(self.note_paths)}
+        return self._by_path.get(path)
+
+    def rows_of_notes(self, paths: Iterable[str]):
+        js = [j for j in (self.note_index(str(p)) for p in paths) if j is not None]
+        return np.flatnonzero(np.isin(self.chunk_note, js)) if js else np.zeros(0, dtype=np.int64)
+
+    def take(self, keep) -> "ChunkTable":
+        chunk_note = self.chunk_note[keep]
+        used, remap = np.unique(chunk_note, return_inverse=True)
+        pick = lambda col: [col[j] for j in used.tolist()]
+        return ChunkTable(pick(self.note_ids), pick(self.note_paths), pick(self.note_titles),
+                          pick(self.note_created), remap.astype(np.int32), self.chunk_ord[keep],
+                          self.texts.take(keep))
+
+    def append(self, chunks: List[Chunk]) -> "ChunkTable":
+        ids, paths, titles, created = list(self.note_ids), list(self.note_paths), list(self.note_titles), \
+            list(self.note_created)
+        seen = {p: j for j, p in enumerate(paths)}
+        notes = np.zeros(len(chunks), dtype=np.int32)
+        ords = np.zeros(len(chunks), dtype=np.int32)
+        for i, c in enumerate(chunks):
+            nid, _, ordinal = c.chunk_id.rpartition(":")
+            j = seen.get(c.note_path)
+            if j is None:
+                j = seen[c.note_path] = len(paths)
+                ids.append(nid)
+                paths.append(c.note_path)
+                titles.append(c.note_title)
+                created.append(c.note_created)
+            notes[i] = j
+            ords[i] = int(ordinal or 0)
+        return ChunkTable(ids, paths, titles, created, np.concatenate([self.chunk_note, notes]),
+                          np.concatenate([self.chunk_ord, ords]), self.texts.append([c.text for c in chunks]))
+
+class Projection:
+    # LSA projection (TruncatedSVD components + L2 row normalisation) kept as a
+    # plain array so it can be saved without pickling sklearn objects.
+    def __init__(self, components):
+        self.components = np.asarray(components, dtype=np.float32)
+        # contiguous float32 transpose: a float64 sparse input or a strided
+        # operand would make scipy upcast/copy the whole (V, d) array per call
+        self._components_t = np.ascontiguousarray(self.components.T)
+
+    def transform(self, X):
+        if hasattr(X, "astype"):
+            X = X.astype(np.float32, copy=False)
+        return self.normalize(X @ self._components_t)
+
+    @staticmethod
+    def normalize(rows):
+        out = np.asarray(rows, dtype=np.float32)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+class RowBlocks:
+    # Several 2-D arrays (the per-shard mmaps of a loaded index) seen as one
+    # matrix without concatenating them. Slices and row gathers return plain
+    # arrays; take() keeps long runs of rows as views, so shards an update
+    # didn't touch stay on their mmap.
+    def __init__(self, parts: list):
+        self.parts = [p for p in parts if len(p)] or list(parts[:1])
+        self.starts = np.concatenate([[0], np.cumsum([len(p) for p in self.parts])]).astype(np.int64)
+        self.shape = (int(self.starts[-1]),) + tuple(self.parts[0].shape[1:])
+        self.dtype = self.parts[0].dtype
+        self.ndim = len(self.shape)
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(p.nbytes for p in self.parts)
+
+    def __array__(self, dtype=None, copy=None):
+        out = np.concatenate(self.parts) if len(self.parts) > 1 else np.asarray(self.parts[0])
+        return out if dtype is None else out.astype(dtype, copy=False)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, _ = key.indices(len(self))
+            pieces = []
+            for p, (a, b) in enumerate(zip(self.starts[:-1], self.starts[1:])):
+                if a < stop and b > start:
+                    pieces.append(self.parts[p][max(start, a) - a:min(stop, b) - a])
+            if len(pieces) == 1:
+                return pieces[0]
+            return np.concatenate(pieces) if pieces else self.parts[0][:0]
+        rows = np.asarray(key)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        part = np.searchsorted(self.starts, rows, side="right") - 1
+        out = np.empty((len(rows),) + self.shape[1:], dtype=self.dtype)
+        for p in np.unique(part).tolist():
+            sel = part == p
+            out[sel] = self.parts[p][rows[sel] - self.starts[p]]
+        return out
+
+    def take(self, rows) -> "RowBlocks":
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return RowBlocks([self.parts[0][:0]])
+        part = np.searchsorted(self.starts, rows, side="right") - 1
+        cut = (np.flatnonzero((np.diff(rows) != 1) | (np.diff(part) != 0)) + 1).tolist()
+        out, loose = [], []
+        for a, b in zip([0] + cut, cut + [len(rows)]):
+            if b - a < 64:
+                loose.append(rows[a:b])
+                continue
+            if loose:
+                out.append(self[np.concatenate(loose)])
+                loose = []
+            p = int(part[a])
+            lo = int(rows[a] - self.starts[p])
+            out.append(self.parts[p][lo:lo + b - a])
+        if loose:
+            out.append(self[np.concatenate(loose)])
+        return RowBlocks(out)
+
+    def append(self, rows) -> "RowBlocks":
+        return RowBlocks(self.parts + [np.asarray(rows, dtype=self.dtype)])
+
+def _rows_take(mat, keep):
+    return mat.take(keep) if isinstance(mat, RowBlocks) else mat[keep]
+
+def _rows_append(mat, rows):
+    if isinstance(mat, RowBlocks):
+        return mat.append(rows)
+    return np.vstack([mat, np.asarray(rows, dtype=mat.dtype)])
+
+def _quantize(rows) -> Tuple[any, any]:
+    # symmetric per-row int8 quantisation: row ~= codes * scale
+    rows = np.asarray(rows, dtype=np.float32)
+    scales = np.abs(rows).max(axis=1) / 127.0 if len(rows) else np.zeros(0, dtype=np.float32)
+    scales[scales == 0] = 1.0
+    codes = np.round(rows / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+@dataclass
+class Ivf:
+    # Coarse IVF index over the LSA matrix: every row belongs to the list of
+    # its nearest centroid, and an int8 copy of the matrix is used to score
+    # the rows of the probed lists before an exact float32 re-rank.
+    centroids: any  # (lists, d) float32, L2-normalised
+    assign: any     # (rows,) int32 list id of each matrix row
+    codes: any      # (rows, d) int8
+    scales: any     # (rows,) float32
+    order: any = None    # rows grouped by list (derived from assign)
+    offsets: any = None  # list l owns order[offsets[l]:offsets[l+1]]
+
+    def __post_init__(self):
+        if self.order is None:
+            self.order = np.argsort(self.assign, kind="stable").astype(np.int32)
+            counts = np.bincount(self.assign, minlength=len(self.centroids))
+            self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def take(self, keep) -> "Ivf":
+        return Ivf(self.centroids, self.assign[keep], _rows_take(self.codes, keep), self.scales[keep])
+
+    def append(self, rows) -> "Ivf":
+        assign = np.argmax(rows @ self.centroids.T, axis=1).astype(np.int32)
+        codes, scales = _quantize(rows)
+        return Ivf(self.centroids, np.concatenate([self.assign, assign]),
+                   _rows_append(self.codes, codes), np.concatenate([self.scales, scales]))
+
+    def candidates(self, qvec, probes: int):
+        csims = self.centroids @ qvec
+        probes = max(1, min(probes, len(csims)))
+        lists = np.argpartition(-csims, probes - 1)[:probes]
+        return np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+
+def build_ivf(matrix, seed: int = 0) -> Ivf:
+    from sklearn.cluster import MiniBatchKMeans
+    matrix = np.asarray(matrix, dtype=np.float32)
+    n_lists = max(1, min(4096, int(np.sqrt(len(matrix)))))
+    km = MiniBatchKMeans(n_clusters=n_lists, random_state=seed, n_init=3, batch_size=4096)
+    assign = km.fit_predict(matrix).astype(np.int32)
+    centroids = Projection.normalize(km.cluster_centers_)
+    codes, scales = _quantize(matrix)
+    return Ivf(centroids, assign, codes, scales)
+
+@dataclass
+class NoteVectors:
+    # Per-note view of the chunk rows: which note each chunk belongs to (in
+    # order of first appearance) and the normalised mean of its chunk rows.
+    chunk_note: any  # (rows,) int32
+    centroids: any   # (notes, d) float32
+    order: any = None    # chunk rows grouped by note (derived)
+    offsets: any = None  # note j owns order[offsets[j]:offsets[j+1]]
+
+    def __post_init__(self):
+        if self.order is None:
+            self.order = np.argsort(self.chunk_note, kind="stable").astype(np.int32)
+            counts = np.bincount(self.chunk_note, minlength=len(self.centroids))
+            self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def rows_of(self, notes):
+        return np.concatenate([self.order[self.offsets[j]:self.offsets[j + 1]] for j in notes])
+
+def _note_centroids(chunk_note, matrix, out, block: int = 65536):
+    # Sums each run of same-note rows into the zeroed (notes, d) `out` block
+    # by block and normalises it in place, so neither a reordered copy nor
+    # the whole matrix is ever held at once.
+    for start in range(0, len(chunk_note), block):
+        rows = np.asarray(matrix[start:start + block], dtype=np.float32)
+        cn = chunk_note[start:start + block]
+        runs = np.concatenate([[0], np.flatnonzero(cn[1:] != cn[:-1]) + 1])
+        np.add.at(out, cn[runs], np.add.reduceat(rows, runs))
+    for start in range(0, len(out), block):
+        out[start:start + block] = Projection.normalize(out[start:start + block])
+    return out
+
+def build_note_vectors(chunks: ChunkTable, matrix, block: int = 65536) -> NoteVectors:
+    sums = np.zeros((len(chunks.note_paths), matrix.shape[1]), dtype=np.float32)
+    return NoteVectors(chunks.chunk_note, _note_centroids(chunks.chunk_note, matrix, sums, block))
+
+@dataclass(frozen=True)
+class Shard:
+    key: str    # shard_key() of the notes in it
+    start: int  # rows [start, end) of the index
+    end: int
+    dir: Optional[str] = None  # saved directory holding exactly these rows; None once they changed
+
 @dataclass
 class Index:
-    chunks: List[Chunk]
+    chunks: ChunkTable
     vectorizer: TfidfVectorizer
-    lsa: any
+    lsa: Projection
     matrix: any  # np.ndarray
+    ivf: Optional[Ivf] = None  # only built for large vaults with ANN enabled
+    notes: Optional[NoteVectors] = None  # built lazily by note_vectors()
+    fitted_rows: int = 0  # chunks seen by the last full fit
+    drift_rows: int = 0   # chunks added/removed incrementally since then
+    stats: dict = field(default_factory=dict)  # per-phase timings of the last full build
+    generation: int = 0  # set by ResidentIndex when this index is published
+    profile: IndexProfile = field(default_factory=IndexProfile)
+    shards: List[Shard] = field(default_factory=list)  # row ranges by shard key, in key order
+    model_dir: Optional[str] = None  # saved vocabulary/components this index uses, set by save/load
+
+# Share of the corpus that may change incrementally before a full refit is due.
+DRIFT_THRESHOLD = 0.25
 
-def chunk_text(text: str, max_chars: int = 900, overlap: int = 120) -> List[str]:
+def chunk_text(text: str, max_chars: int = 900, overlap: int = 120, min_chars: int = 0) -> List[str]:
     t = (text or "").strip()
     if not t:
         return []
@@ -52,61 +465,713 @@ def chunk_text(text: str, max_chars: int = 900, overlap: int = 120) -> List[str]
                 cur = ""
     if cur:
         chunks.append(cur)
+    if min_chars and len(chunks) > 1 and len(chunks[-1]) < min_chars:
+        tail = chunks.pop()
+        chunks[-1] = chunks[-1] + "\n\n" + tail
     return chunks
 
-def build_index(notes: List[dict]) -> Index:
+def note_chunks(n: dict, profile: Optional[IndexProfile] = None) -> List[Chunk]:
+    p = profile or IndexProfile()
+    return [Chunk(
+        note_path=str(n["path"]),
+        note_title=n["title"],
+        note_created=n["created"],
+        text=ct,
+        chunk_id=f"{n['id']}:{i}"
+    ) for i, ct in enumerate(chunk_text(n["body"], p.chunk_max_chars, p.chunk_overlap_chars, p.chunk_min_chars))]
+
+def build_index(notes: List[dict], profile: Optional[IndexProfile] = None) -> Index:
     chunks: List[Chunk] = []
     for n in notes:
-        ctexts = chunk_text(n["body"])
-        for i, ct in enumerate(ctexts):
-            chunks.append(Chunk(
-                note_path=str(n["path"]),
-                note_title=n["title"],
-                note_created=n["created"],
-                text=ct,
-                chunk_id=f"{n['id']}:{i}"
-            ))
-    texts = [c.text for c in chunks] or [""]
-    vectorizer = TfidfVectorizer(stop_words="english", ngram_range=(1,2), max_features=50000)
-    tfidf = vectorizer.fit_transform(texts)
+        chunks.extend(note_chunks(n, profile))
+    return build_index_from_chunks(chunks, profile=profile)
+
+def _new_vectorizer(profile: IndexProfile) -> TfidfVectorizer:
+    return _sklearn_text()(stop_words="english", ngram_range=(1, max(1, profile.ngram_max)),
+                           max_features=profile.max_features)
+
+def _fit_lsa(tfidf, dims: int = 256) -> Projection:
     # LSA for semantic-ish matching on CPU
-    n_comp = min(256, max(2, tfidf.shape[1]//4), tfidf.shape[0]-1 if tfidf.shape[0] > 1 else 2)
+    n_comp = min(dims, max(2, tfidf.shape[1]//4), tfidf.shape[0]-1 if tfidf.shape[0] > 1 else 2)
     if n_comp < 2:
         n_comp = 2
+    from sklearn.decomposition import TruncatedSVD
+
     svd = TruncatedSVD(n_components=min(n_comp, tfidf.shape[1]-1) if tfidf.shape[1] > 2 else 2, random_state=0)
-    lsa = make_pipeline(svd, Normalizer(copy=False))
-    mat = lsa.fit_transform(tfidf)
-    return Index(chunks=chunks, vectorizer=vectorizer, lsa=lsa, matrix=mat)
+    svd.fit(tfidf)
+    return Projection(svd.components_)
+
+def build_index_from_chunks(chunks: List[Chunk], stats: Optional[dict] = None,
+                            ann: bool = False, ann_min_rows: int = 20000,
+                            profile: Optional[IndexProfile] = None) -> Index:
+    profile = profile or IndexProfile()
+    stats = dict(stats or {})
+    t0 = time.perf_counter()
+    chunks = sorted(chunks, key=lambda c: shard_key(c.note_created, profile.shard_by))  # stable: notes stay grouped
+    texts = [c.text for c in chunks] or [""]
+    vectorizer = _new_vectorizer(profile)
+    tfidf = vectorizer.fit_transform(texts)
+    t1 = time.perf_counter()
+    lsa = _fit_lsa(tfidf, profile.svd_dims)
+    t2 = time.perf_counter()
+    mat = lsa.transform(tfidf).astype(profile.dtype, copy=False)
+    t3 = time.perf_counter()
+    stats.update(tfidf_s=round(t1 - t0, 4), svd_s=round(t2 - t1, 4), project_s=round(t3 - t2, 4),
+                 chunks=len(chunks))
+    idx = Index(chunks=ChunkTable.from_chunks(chunks), vectorizer=vectorizer, lsa=lsa, matrix=mat,
+                fitted_rows=len(chunks), stats=stats, profile=profile)
+    _regroup(idx)
+    if ann and len(chunks) >= ann_min_rows:
+        idx.ivf = build_ivf(mat)
+        t4 = time.perf_counter()
+        stats.update(ivf_s=round(t4 - t3, 4), ivf_lists=len(idx.ivf.centroids))
+        for probes in (4, 8, 16):
+            stats[f"ann_recall@10_p{probes}"] = round(ann_recall(idx, _sample_rows(mat), 10, probes), 4)
+    record_build_phases(stats)
+    return idx
+
+def record_build_phases(stats: dict) -> None:
+    for k, v in stats.items():
+        if k.endswith("_s"):
+            METRICS.observe("index_build_phase_seconds", v, phase=k[:-2])
+
+def note_vectors(idx: Index) -> NoteVectors:
+    if idx.notes is None:
+        idx.notes = build_note_vectors(idx.chunks, idx.matrix)
+    return idx.notes
+
+def _take_rows(idx: Index, keep) -> None:
+    # A note keeps all of its rows or none (removal is per note, regrouping
+    # only reorders), so the centroids of the notes left are unchanged.
+    if idx.notes is not None:
+        kept = np.unique(idx.chunks.chunk_note[keep])
+    idx.chunks = idx.chunks.take(keep)
+    if idx.notes is not None:
+        idx.notes = NoteVectors(idx.chunks.chunk_note, idx.notes.centroids[kept])
+    idx.matrix = _rows_take(idx.matrix, keep)
+    if idx.ivf is not None:
+        idx.ivf = idx.ivf.take(keep)
+
+def _append_rows(idx: Index, chunks: List[Chunk], rows) -> None:
+    # only the centroids of the notes being added are computed
+    old_notes = len(idx.chunks.note_paths)
+    idx.chunks = idx.chunks.append(chunks)
+    if idx.notes is not None:
+        new = idx.chunks.chunk_note[-len(chunks):] - old_notes
+        if len(new) and new.min() < 0:  # rows added to a note already there
+            idx.notes = None
+        else:
+            sums = np.zeros((len(idx.chunks.note_paths) - old_notes, rows.shape[1]), dtype=np.float32)
+            np.add.at(sums, new, np.asarray(rows, dtype=np.float32))
+            idx.notes = NoteVectors(idx.chunks.chunk_note,
+                                    np.concatenate([idx.notes.centroids, Projection.normalize(sums)]))
+    idx.matrix = _rows_append(idx.matrix, rows)
+    if idx.ivf is not None:
+        idx.ivf = idx.ivf.append(rows)
+
+def _regroup(idx: Index, dirty: Iterable[str] = ()) -> None:
+    # Keep rows grouped by shard in key order (a stable sort, so each note's
+    # rows stay together) and recompute the shard ranges. Shards in `dirty`
+    # lost or gained rows and forget their saved directory.
+    t = idx.chunks
+    keys = [shard_key(c, idx.profile.shard_by) for c in t.note_created]
+    names = sorted(set(keys))
+    code = {k: i for i, k in enumerate(names)}
+    row_code = np.array([code[k] for k in keys], dtype=np.int32)[t.chunk_note] if keys else t.chunk_note
+    if len(row_code) > 1 and bool(np.any(row_code[1:] < row_code[:-1])):
+        perm = np.argsort(row_code, kind="stable")
+        _take_rows(idx, perm)
+        row_code = row_code[perm]
+    bounds = np.searchsorted(row_code, np.arange(len(names) + 1)).tolist()
+    dirty = set(dirty)
+    saved = {s.key: s.dir for s in idx.shards}
+    idx.shards = [Shard(k, bounds[i], bounds[i + 1], None if k in dirty else saved.get(k))
+                  for i, k in enumerate(names)]
+
+def _shard_keys(idx: Index, notes) -> set:
+    return {shard_key(idx.chunks.note_created[j], idx.profile.shard_by) for j in np.unique(notes).tolist()}
+
+def remove_notes(idx: Index, paths: Iterable) -> int:
+    drop = {str(p) for p in paths}
+    if not drop:
+        return 0
+    dropped = idx.chunks.rows_of_notes(drop)
+    removed = len(dropped)
+    if removed:
+        dirty = _shard_keys(idx, idx.chunks.chunk_note[dropped])
+        keep = np.setdiff1d(np.arange(len(idx.chunks)), dropped)
+        _take_rows(idx, keep)
+        _regroup(idx, dirty)
+        idx.drift_rows += removed
+    return removed
+
+def upsert_notes(idx: Index, notes: List[dict]) -> int:
+    # Project new chunks through the fitted vectorizer/LSA; vocabulary and
+    # components stay fixed until the next full refit.
+    remove_notes(idx, [n["path"] for n in notes])
+    new = [c for n in notes for c in note_chunks(n, idx.profile)]
+    if new:
+        rows = idx.lsa.transform(idx.vectorizer.transform([c.text for c in new]))
+        _append_rows(idx, new, rows)
+        _regroup(idx, {shard_key(c.note_created, idx.profile.shard_by) for c in new})
+        idx.drift_rows += len(new)
+    return len(new)
+
+def needs_refit(idx: Index, threshold: float = DRIFT_THRESHOLD) -> bool:
+    return not idx.fitted_rows or idx.drift_rows > threshold * idx.fitted_rows
+
+# On-disk layout: <index_path>/CURRENT names the live version directory,
+# whose header.json lists the model directory (vectorizer vocabulary/idf,
+# SVD components and IVF centroids, shared by all shards) and one directory
+# per shard under shards/, each holding its chunk metadata as columns, its
+# slice of the LSA matrix (opened with mmap) and its note centroids. A save
+# rewrites only the shards whose rows changed and reuses the other
+# directories, writes a fresh version directory and then atomically replaces
+# CURRENT, so readers never observe a half-written index.
+
+def _write_strings(d: Path, name: str, items: List[str]) -> None:
+    data = [x.encode("utf-8") for x in items]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in data], out=offsets[1:])
+    (d / f"{name}.bin").write_bytes(b"".join(data))
+    np.save(d / f"{name}.off.npy", offsets)
+
+def _read_strings(d: Path, name: str) -> List[str]:
+    blob = (d / f"{name}.bin").read_bytes()
+    offsets = np.load(d / f"{name}.off.npy").tolist()
+    return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+def _current_version(path: Path) -> Optional[Path]:
+    try:
+        name = (path / "CURRENT").read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    return path / name if name else None
+
+class _StringColumn:
+    # streaming counterpart of _write_strings
+    def __init__(self, d: Path, name: str):
+        self.d = d
+        self.name = name
+        self.f = (d / f"{name}.bin").open("wb")
+        self.offsets = array("q", [0])
+
+    def add(self, x: str) -> None:
+        b = x.encode("utf-8")
+        self.f.write(b)
+        self.offsets.append(self.offsets[-1] + len(b))
+
+    def close(self) -> None:
+        self.f.close()
+        np.save(self.d / f"{self.name}.off.npy", np.frombuffer(self.offsets, dtype=np.int64))
+
+def _begin_version(path: Path) -> Tuple[Path, str]:
+    if path.is_file():
+        path.unlink()  # legacy index.pkl at the configured location
+    path.mkdir(parents=True, exist_ok=True)
+    name = f"v-{time.time_ns()}-{os.getpid()}"
+    tmp = path / f".tmp-{name}"
+    tmp.mkdir()
+    return tmp, name
+
+def _write_model(d: Path, vectorizer: TfidfVectorizer, lsa: Projection, ivf: Optional[Ivf] = None) -> None:
+    d.mkdir(parents=True)
+    _write_strings(d, "vocab", vectorizer.get_feature_names_out().tolist())
+    np.save(d / "idf.npy", np.asarray(vectorizer.idf_, dtype=np.float64))
+    np.save(d / "components.npy", lsa.components)
+    if ivf is not None:
+        np.save(d / "ivf_centroids.npy", ivf.centroids)
+
+def _write_shard(d: Path, t: ChunkTable, matrix, rows, ivf: Optional[Tuple] = None, block: int = 65536) -> None:
+    # rows: indices of this shard's rows in matrix; ivf: its (assign, codes,
+    # scales). The rows are copied and the note centroids computed `block`
+    # rows at a time into mmap'd files, so a shard is never held in memory.
+    d.mkdir(parents=True)
+    _write_strings(d, "note_id", t.note_ids)
+    _write_strings(d, "note_path", t.note_paths)
+    _write_strings(d, "note_title", t.note_titles)
+    _write_strings(d, "note_created", t.note_created)
+    np.save(d / "chunk_note.npy", t.chunk_note)
+    np.save(d / "chunk_ord.npy", t.chunk_ord)
+    texts = _StringColumn(d, "chunk_text")
+    for i in range(len(t)):
+        texts.add(t.texts[i])
+    texts.close()
+    out = np.lib.format.open_memmap(d / "matrix.npy", mode="w+", dtype=matrix.dtype,
+                                    shape=(len(rows),) + tuple(matrix.shape[1:]))
+    for start in range(0, len(rows), block):
+        out[start:start + block] = matrix[rows[start:start + block]]
+    cents = np.lib.format.open_memmap(d / "note_centroids.npy", mode="w+", dtype=np.float32,
+                                      shape=(len(t.note_paths), out.shape[1]))
+    _note_centroids(t.chunk_note, out, cents, block)
+    out.flush()
+    cents.flush()
+    del out, cents
+    if ivf is not None:
+        for name, col in zip(("ivf_assign", "ivf_codes", "ivf_scales"), ivf):
+            np.save(d / f"{name}.npy", np.ascontiguousarray(col))
+
+def _shard_dir(key: str, name: str) -> str:
+    return f"shards/{re.sub(r'[^0-9A-Za-z-]', '_', key)}-{name[2:]}"
+
+def _write_header(d: Path, idx_like: dict, vectorizer: TfidfVectorizer) -> None:
+    header = {"format": INDEX_FORMAT, "version": INDEX_VERSION, **idx_like,
+              "vectorizer": {"stop_words": vectorizer.stop_words, "ngram_range": list(vectorizer.ngram_range)}}
+    (d / "header.json").write_text(json.dumps(header, indent=1), encoding="utf-8")
+
+def _commit_version(path: Path, tmp: Path, name: str, live: Iterable[str] = ()) -> None:
+    tmp.rename(path / name)
+    cur_tmp = path / f".CURRENT-{name}"
+    cur_tmp.write_text(name, encoding="utf-8")
+    os.replace(cur_tmp, path / "CURRENT")
+    # drop older versions and the model/shard directories the new one doesn't use;
+    # may fail on Windows while another process still maps the files
+    live = set(live)
+    for old in path.iterdir():
+        if old.name in ("models", "shards"):
+            for sub in old.iterdir():
+                if f"{old.name}/{sub.name}" not in live:
+                    shutil.rmtree(sub, ignore_errors=True)
+        elif old.is_dir() and old.name != name:
+            shutil.rmtree(old, ignore_errors=True)
 
 def save_index(idx: Index, path: Path) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("wb") as f:
-        pickle.dump(idx, f)
+    with METRICS.timed("index_build_phase_seconds", phase="save"):
+        _save_index(idx, path)
+
+def _save_index(idx: Index, path: Path) -> None:
+    tmp, name = _begin_version(path)
+    model = idx.model_dir
+    if not model or not (path / model).is_dir():
+        model = f"models/m-{name[2:]}"
+        _write_model(path / model, idx.vectorizer, idx.lsa, idx.ivf)
+    shards, written = [], 0
+    for s in idx.shards:
+        if not s.dir or not (path / s.dir).is_dir():
+            s = replace(s, dir=_shard_dir(s.key, name))
+            span, rows = slice(s.start, s.end), np.arange(s.start, s.end)
+            ivf = idx.ivf
+            _write_shard(path / s.dir, idx.chunks.take(rows), idx.matrix, rows,
+                         (ivf.assign[span], ivf.codes[span], ivf.scales[span]) if ivf is not None else None)
+            written += 1
+        shards.append(s)
+    _write_header(tmp, {
+        "rows": len(idx.chunks),
+        "dims": int(idx.lsa.components.shape[0]),
+        "fitted_rows": idx.fitted_rows,
+        "drift_rows": idx.drift_rows,
+        "stats": idx.stats,
+        "ivf": idx.ivf is not None,
+        "profile": asdict(idx.profile),
+        "model": model,
+        "shards": [{"key": s.key, "dir": s.dir, "rows": s.end - s.start} for s in shards],
+    }, idx.vectorizer)
+    _commit_version(path, tmp, name, [model] + [s.dir for s in shards])
+    METRICS.inc("index_shards_written_total", written)
+    idx.model_dir, idx.shards = model, shards
+
+def build_index_streaming(chunks: Iterable[Chunk], path: Path, memory_mb: int = 256,
+                          stats: Optional[dict] = None, profile: Optional[IndexProfile] = None) -> Optional[Index]:
+    # Bounded-memory full build written straight into a new index version:
+    #   1. stream chunks once, spilling texts and note/chunk columns to a
+    #      staging directory and keeping a reservoir sample sized from the
+    #      memory budget;
+    #   2. fit the vocabulary/idf and SVD on the sample only;
+    #   3. re-read the spilled texts in batches and project each batch into
+    #      an open_memmap'd staging matrix;
+    #   4. copy the rows of each shard out of the staging files into its own
+    #      directory, one shard and `batch` rows at a time, deriving note
+    #      centroids blockwise.
+    # Chunks must arrive grouped by note. No IVF is built in this mode.
+    profile = profile or IndexProfile()
+    stats = dict(stats or {})
+    budget = max(16, memory_mb) * 1024 * 1024
+    sample_cap = max(2000, budget // 16384)
+    rnd = random.Random(0)
+    t0 = time.perf_counter()
+    tmp, name = _begin_version(path)
+    stage = tmp / "stage"
+    stage.mkdir()
+    live: List[str] = []
+    try:
+        texts = _StringColumn(stage, "chunk_text")
+        cols = {k: _StringColumn(stage, k) for k in ("note_id", "note_path", "note_title", "note_created")}
+        chunk_note = array("i")
+        chunk_ord = array("i")
+        sample: List[str] = []
+        last_path = None
+        n = 0
+        for c in chunks:
+            nid, _, ordinal = c.chunk_id.rpartition(":")
+            if c.note_path != last_path:
+                last_path = c.note_path
+                for k, v in (("note_id", nid), ("note_path", c.note_path), ("note_title", c.note_title),
+                             ("note_created", c.note_created)):
+                    cols[k].add(v)
+            chunk_note.append(len(cols["note_path"].offsets) - 2)
+            chunk_ord.append(int(ordinal or 0))
+            texts.add(c.text)
+            if len(sample) < sample_cap:
+                sample.append(c.text)
+            else:
+                j = rnd.randrange(n + 1)
+                if j < sample_cap:
+                    sample[j] = c.text
+            n += 1
+        texts.close()
+        for col in cols.values():
+            col.close()
+        chunk_note = np.frombuffer(chunk_note, dtype=np.int32) if n else np.zeros(0, dtype=np.int32)
+        chunk_ord = np.frombuffer(chunk_ord, dtype=np.int32) if n else np.zeros(0, dtype=np.int32)
+        t1 = time.perf_counter()
+
+        vectorizer = _new_vectorizer(profile)
+        tfidf = vectorizer.fit_transform(sample or [""])
+        lsa = _fit_lsa(tfidf, profile.svd_dims)
+        del sample, tfidf
+        model = f"models/m-{name[2:]}"
+        _write_model(path / model, vectorizer, lsa)
+        live.append(model)
+        t2 = time.perf_counter()
+
+        d = lsa.components.shape[0]
+        batch = int(max(256, min(65536, budget // (d * 16 + 16384))))
+        mat = np.lib.format.open_memmap(stage / "matrix.npy", mode="w+", dtype=profile.dtype, shape=(n, d))
+        offsets = np.load(stage / "chunk_text.off.npy", mmap_mode="r")
+        with (stage / "chunk_text.bin").open("rb") as f:
+            for start in range(0, n, batch):
+                end = min(n, start + batch)
+                base = int(offsets[start])
+                blob = f.read(int(offsets[end]) - base)
+                part = [blob[int(offsets[i]) - base:int(offsets[i + 1]) - base].decode("utf-8")
+                        for i in range(start, end)]
+                mat[start:end] = lsa.transform(vectorizer.transform(part))
+        mat.flush()
+        del offsets
+        t3 = time.perf_counter()
+
+        flat = ChunkTable(_read_strings(stage, "note_id"), _read_strings(stage, "note_path"),
+                          _read_strings(stage, "note_title"), _read_strings(stage, "note_created"),
+                          chunk_note, chunk_ord, TextColumn.from_blob(_Blob(stage, "chunk_text")))
+        keys = [shard_key(c, profile.shard_by) for c in flat.note_created]
+        names = sorted(set(keys))
+        code = {k: i for i, k in enumerate(names)}
+        row_code = np.array([code[k] for k in keys], dtype=np.int32)[chunk_note] if keys else chunk_note
+        order = np.argsort(row_code, kind="stable")
+        bounds = np.searchsorted(row_code[order], np.arange(len(names) + 1)).tolist()
+        shards = []
+        for i, key in enumerate(names):
+            rows = order[bounds[i]:bounds[i + 1]]
+            sdir = _shard_dir(key, name)
+            _write_shard(path / sdir, flat.take(rows), mat, rows, block=batch)
+            live.append(sdir)
+            shards.append({"key": key, "dir": sdir, "rows": len(rows)})
+        del mat, flat
+        shutil.rmtree(stage)
+        t4 = time.perf_counter()
+
+        stats.update(stream_spill_s=round(t1 - t0, 4), fit_s=round(t2 - t1, 4), project_s=round(t3 - t2, 4),
+                     shards_s=round(t4 - t3, 4), chunks=n, sample_rows=min(n, sample_cap),
+                     batch_rows=batch, memory_mb=memory_mb)
+        record_build_phases(stats)
+        _write_header(tmp, {"rows": n, "dims": int(d), "fitted_rows": n, "drift_rows": 0,
+                            "stats": stats, "ivf": False, "profile": asdict(profile),
+                            "model": model, "shards": shards}, vectorizer)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        for sub in live:
+            shutil.rmtree(path / sub, ignore_errors=True)
+        raise
+    _commit_version(path, tmp, name, live)
+    return load_index(path)
 
 def load_index(path: Path) -> Optional[Index]:
-    if not path.exists():
+    with METRICS.timed("index_build_phase_seconds", phase="load"):
+        return _load_index(path)
+
+def index_disk_bytes(path: Path) -> int:
+    d = _current_version(path) if path.is_dir() else None
+    if d is None:
+        return 0
+    try:
+        header = json.loads((d / "header.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return 0
+    dirs = [d, path / header.get("model", "")] + [path / s["dir"] for s in header.get("shards", [])]
+    return sum(e.stat().st_size for x in dirs if x.is_dir() for e in os.scandir(x) if e.is_file())
+
+def _read_table(d: Path) -> ChunkTable:
+    return ChunkTable(_read_strings(d, "note_id"), _read_strings(d, "note_path"), _read_strings(d, "note_title"),
+                      _read_strings(d, "note_created"), np.load(d / "chunk_note.npy"), np.load(d / "chunk_ord.npy"),
+                      TextColumn.from_blob(_Blob(d, "chunk_text")))
+
+def _load_index(path: Path) -> Optional[Index]:
+    d = _current_version(path) if path.is_dir() else None
+    if d is None:
         return None
     try:
-        with path.open("rb") as f:
-            return pickle.load(f)
+        header = json.loads((d / "header.json").read_text(encoding="utf-8"))
+        if header.get("format") != INDEX_FORMAT or header.get("version") != INDEX_VERSION:
+            return None
+        profile = IndexProfile.from_dict(header.get("profile"))
+        m = path / header["model"]
+        terms = _read_strings(m, "vocab")
+        vc = header["vectorizer"]
+        vectorizer = _sklearn_text()(stop_words=vc["stop_words"], ngram_range=tuple(vc["ngram_range"]),
+                                     vocabulary={t: i for i, t in enumerate(terms)})
+        vectorizer.idf_ = np.load(m / "idf.npy")
+        lsa = Projection(np.load(m / "components.npy"))
+        tables, mats, cents, ivf_cols, shards = [], [], [], [], []
+        start = 0
+        for s in header["shards"]:
+            sd = path / s["dir"]
+            tables.append(_read_table(sd))
+            mats.append(np.load(sd / "matrix.npy", mmap_mode="r"))
+            cents.append(np.load(sd / "note_centroids.npy"))
+            if header.get("ivf"):
+                ivf_cols.append((np.load(sd / "ivf_assign.npy"), np.load(sd / "ivf_codes.npy", mmap_mode="r"),
+                                 np.load(sd / "ivf_scales.npy")))
+            shards.append(Shard(s["key"], start, start + len(mats[-1]), s["dir"]))
+            start += len(mats[-1])
+        dims = lsa.components.shape[0]
+        chunks = ChunkTable.concat(tables)
+        matrix = RowBlocks(mats or [np.zeros((0, dims), dtype=profile.dtype)])
+        notes = NoteVectors(chunks.chunk_note, np.concatenate(cents) if cents else np.zeros((0, dims), np.float32))
+        ivf = None
+        if header.get("ivf"):
+            assign, codes, scales = zip(*ivf_cols) if ivf_cols else ((), (), ())
+            ivf = Ivf(np.load(m / "ivf_centroids.npy"), np.concatenate((np.zeros(0, np.int32),) + assign),
+                      RowBlocks(list(codes) or [np.zeros((0, dims), dtype=np.int8)]),
+                      np.concatenate((np.zeros(0, np.float32),) + scales))
     except Exception:
         return None
+    return Index(chunks=chunks, vectorizer=vectorizer, lsa=lsa, matrix=matrix, ivf=ivf, notes=notes,
+                 fitted_rows=header.get("fitted_rows", 0), drift_rows=header.get("drift_rows", 0),
+                 stats=header.get("stats", {}), profile=profile, shards=shards, model_dir=header["model"])
 
-def search(idx: Index, query: str, top_k: int = 10) -> List[Tuple[Chunk, float]]:
-    q = (query or "").strip()
-    if not q or not idx.chunks:
-        return []
-    qv = idx.vectorizer.transform([q])
-    qmat = idx.lsa.transform(qv)  # shape (1, d)
+class ResidentIndex:
+    # Keeps the loaded index in memory for all requests. The on-disk index is
+    # only re-read when the stamp of its CURRENT pointer changes (e.g. another
+    # process rebuilt it); new versions are published by swapping one reference and
+    # bumping `generation`.
+    def __init__(self, path: Path):
+        self.path = path
+        self.generation = 0
+        self._idx: Optional[Index] = None
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def _disk_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = (self.path / "CURRENT").stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self) -> Optional[Index]:
+        stamp = self._disk_stamp()
+        if stamp is not None and stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    idx = load_index(self.path)
+                    if idx is not None:
+                        self._publish(idx, stamp)
+                    else:
+                        self._stamp = stamp  # unreadable; don't retry until it changes
+        return self._idx
+
+    @property
+    def current(self) -> Optional[Index]:
+        return self._idx
+
+    def publish(self, idx: Index) -> None:
+        # Called right after save_index, so the stamp seen is our own write.
+        with self._lock:
+            self._publish(idx, self._disk_stamp())
+
+    def _publish(self, idx: Index, stamp: Optional[Tuple[int, int]]) -> None:
+        self.generation += 1
+        idx.generation = self.generation
+        self._idx = idx
+        self._stamp = stamp
+
+def _top(scores, k: int):
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    order = np.argpartition(-scores, k)[:k]
+    return order[np.argsort(-scores[order])]
+
+def _scores(mat, q):
+    # mat @ q; a float16 matrix is upcast in blocks, since numpy has no fast
+    # half-precision matmul and a full float32 copy would defeat the point
+    if isinstance(mat, RowBlocks):
+        return np.concatenate([_scores(p, q) for p in mat.parts])
+    if mat.dtype == np.float32:
+        return mat @ q
+    block = 32768
+    out = np.empty((len(mat),) + q.shape[1:], dtype=np.float32)
+    for start in range(0, len(mat), block):
+        out[start:start + block] = np.asarray(mat[start:start + block], dtype=np.float32) @ q
+    return out
+
+def _rank(idx: Index, qvec, top_k: int, probes: Optional[int] = None):
+    # -> (row indices, cosine scores), best first. With `probes` and an IVF
+    # index, only the rows of the `probes` nearest lists are scored.
+    if probes and idx.ivf is not None:
+        ivf = idx.ivf
+        cand = ivf.candidates(qvec, probes)
+        approx = (np.asarray(ivf.codes[cand], dtype=np.float32) @ qvec) * ivf.scales[cand]
+        cand = np.sort(cand[_top(approx, min(len(cand), max(top_k * 4, 32)))])
+        sims = np.asarray(idx.matrix[cand], dtype=np.float32) @ qvec
+        order = _top(sims, top_k)
+        return cand[order], sims[order]
     # cosine similarity since normalized
-    sims = (idx.matrix @ qmat.T).ravel()
-    # top_k indices
-    if len(sims) <= top_k:
-        order = np.argsort(-sims)
-    else:
-        order = np.argpartition(-sims, top_k)[:top_k]
-        order = order[np.argsort(-sims[order])]
-    results = []
-    for i in order:
-        results.append((idx.chunks[int(i)], float(sims[int(i)])))
-    return results
+    sims = _scores(idx.matrix, qvec)
+    order = _top(sims, top_k)
+    return order, sims[order]
+
+def _sample_rows(matrix, n: int = 100, seed: int = 0):
+    rnd = np.random.default_rng(seed)
+    return np.asarray(matrix[np.sort(rnd.choice(len(matrix), size=min(n, len(matrix)), replace=False))])
+
+def ann_recall(idx: Index, queries, top_k: int = 10, probes: int = 8) -> float:
+    # mean share of the exact top_k that the IVF search also returns
+    if idx.ivf is None or not len(queries):
+        return 1.0
+    hits = 0
+    total = 0
+    for qvec in np.asarray(queries, dtype=np.float32):
+        exact = set(_rank(idx, qvec, top_k)[0].tolist())
+        approx = set(_rank(idx, qvec, top_k, probes)[0].tolist())
+        hits += len(exact & approx)
+        total += len(exact)
+    return hits / total if total else 1.0
+
+def _date_ok(created: str, date_from: Optional[str], date_to: Optional[str]) -> bool:
+    # ISO timestamps compare lexicographically; date_to is inclusive at its
+    # own precision ("2024-05" covers all of May). Undated notes are outside
+    # every range.
+    if not DATED_RE.match(created):
+        return False
+    return (not date_from or created >= date_from) and (not date_to or created[:len(date_to)] <= date_to)
+
+def _shard_in_range(key: str, date_from: Optional[str], date_to: Optional[str]) -> bool:
+    if key in ("all", "undated"):
+        return key == "all"
+    lo = not date_from or key[:len(date_from)] >= date_from[:len(key)]
+    return lo and (not date_to or key[:len(date_to)] <= date_to[:len(key)])
+
+def _date_rows(idx: Index, date_from: Optional[str], date_to: Optional[str]):
+    # Rows of the notes created in the range, or None without a range. Only
+    # the shards overlapping the range are looked at.
+    if not date_from and not date_to:
+        return None
+    spans = [np.arange(s.start, s.end) for s in idx.shards if _shard_in_range(s.key, date_from, date_to)]
+    if not spans:
+        return np.zeros(0, dtype=np.int64)
+    rows = np.concatenate(spans)
+    chunk_note = idx.chunks.chunk_note[rows]
+    created = idx.chunks.note_created
+    ok = np.zeros(len(created), dtype=bool)
+    notes = np.unique(chunk_note)
+    ok[notes] = [_date_ok(created[j], date_from, date_to) for j in notes.tolist()]
+    return rows[ok[chunk_note]]
+
+def embed_queries(idx: Index, queries: List[str]):
+    # (m, d) float32 LSA vectors, one transform for the whole batch
+    with METRICS.timed("search_phase_seconds", phase="embed"):
+        return idx.lsa.transform(idx.vectorizer.transform(queries))
+
+def _two_stage(idx: Index, qvecs, top_k: int, per_note: int, rows_ok) -> List[List[Tuple[Chunk, float]]]:
+    # Rank notes by centroid first, then score only the chunks of the best
+    # notes and keep at most `per_note` chunks from any one note. With a date
+    # range only the notes of `rows_ok` are candidates.
+    nv = note_vectors(idx)
+    n_notes = max(5 * top_k, 50)
+    notes = np.unique(nv.chunk_note[rows_ok]) if rows_ok is not None else None
+    cents = nv.centroids if notes is None else nv.centroids[notes]
+    note_sims = np.asarray(cents @ np.asarray(qvecs).T).T  # (m, notes)
+    out = []
+    for qvec, ns in zip(qvecs, note_sims):
+        best = _top(ns, n_notes)
+        rows = nv.rows_of(best if notes is None else notes[best])
+        sims = np.asarray(idx.matrix[rows], dtype=np.float32) @ qvec
+        order = np.argsort(-sims, kind="stable")
+        out.append(_cap_per_note(idx, rows[order], sims[order], top_k, per_note))
+    return out
+
+def _cap_per_note(idx: Index, rows, sims, top_k: int, per_note: int) -> List[Tuple[Chunk, float]]:
+    # rows/sims best first -> at most `per_note` hits from any one note
+    hits: List[Tuple[Chunk, float]] = []
+    taken: dict = {}
+    for r, s in zip(rows.tolist(), sims.tolist()):
+        j = int(idx.chunks.chunk_note[r])
+        if taken.get(j, 0) >= per_note:
+            continue
+        taken[j] = taken.get(j, 0) + 1
+        hits.append((idx.chunks[r], float(s)))
+        if len(hits) >= top_k:
+            break
+    return hits
+
+def search_vectors(idx: Index, qvecs, top_k: int = 10, probes: Optional[int] = None,
+                   date_from: Optional[str] = None, date_to: Optional[str] = None,
+                   per_note: Optional[int] = None) -> List[List[Tuple[Chunk, float]]]:
+    with METRICS.timed("search_phase_seconds", phase="rank"):
+        return _search_vectors(idx, qvecs, top_k, probes, date_from, date_to, per_note)
+
+def _search_vectors(idx: Index, qvecs, top_k: int, probes: Optional[int], date_from: Optional[str],
+                    date_to: Optional[str], per_note: Optional[int]) -> List[List[Tuple[Chunk, float]]]:
+    if not len(qvecs) or not idx.chunks:
+        return [[] for _ in range(len(qvecs))]
+    rows_ok = _date_rows(idx, date_from, date_to)
+    if rows_ok is not None and not len(rows_ok):
+        return [[] for _ in range(len(qvecs))]
+    if probes and idx.ivf is not None and rows_ok is None:
+        # with a per-note cap, over-fetch so capped notes leave enough others
+        k = max(top_k * 4, 50) if per_note else top_k
+        out = []
+        for qvec in qvecs:
+            rows, scores = _rank(idx, qvec, k, probes)
+            out.append(_cap_per_note(idx, rows, scores, top_k, per_note) if per_note else
+                       [(idx.chunks[int(r)], float(s)) for r, s in zip(rows, scores)])
+        return out
+    if per_note:
+        return _two_stage(idx, qvecs, top_k, per_note, rows_ok)
+    mat = idx.matrix if rows_ok is None else idx.matrix[rows_ok]
+    sims = np.asarray(_scores(mat, np.asarray(qvecs).T)).T  # (m, rows), one matrix-matrix product
+    out = []
+    for row_sims in sims:
+        order = _top(row_sims, top_k)
+        rows = order if rows_ok is None else rows_ok[order]
+        out.append([(idx.chunks[int(r)], float(s)) for r, s in zip(rows, row_sims[order])])
+    return out
+
+def search_many(idx: Index, queries: List[str], top_k: int = 10, probes: Optional[int] = None,
+                date_from: Optional[str] = None, date_to: Optional[str] = None,
+                per_note: Optional[int] = None) -> List[List[Tuple[Chunk, float]]]:
+    qs = [(q or "").strip() for q in queries]
+    out: List[List[Tuple[Chunk, float]]] = [[] for _ in qs]
+    live = [i for i, q in enumerate(qs) if q]
+    if not live or not idx.chunks:
+        return out
+    hits = search_vectors(idx, embed_queries(idx, [qs[i] for i in live]), top_k, probes, date_from, date_to,
+                          per_note)
+    for i, h in zip(live, hits):
+        out[i] = h
+    return out
+
+def warm_up(idx: Index) -> None:
+    # Pull the mmap'd matrix into the page cache and run one query so the
+    # first real search doesn't pay for cold pages and first-call setup.
+    if not idx.chunks:
+        return
+    mat = idx.matrix
+    for start in range(0, len(mat), 65536):
+        float(np.asarray(mat[start:start + 65536]).sum())
+    note_vectors(idx)
+    search_many(idx, ["warm up"], 1)
+
+def search(idx: Index, query: str, top_k: int = 10, probes: Optional[int] = None,
+           per_note: Optional[int] = None) -> List[Tuple[Chunk, float]]:
+    return search_many(idx, [query], top_k, probes, per_note=per_note)[0]
@@ -0,0 +1,133 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import json
+import os
+import threading
+import time
+
+from .storage import Note, NoteMeta, plan_new_note, write_note
+
+# Append-only capture journal. A capture is one fsync'd JSON line, so POST
+# /new can return before the .md file exists; a background thread then
+# writes the files in batches and hands their paths to `on_written`. Once
+# everything journaled has been written the log is truncated, and entries
+# left over from a crash are replayed by start().
+class CaptureJournal:
+    def __init__(self, path: Path, on_written: Callable[[List[Path]], None], coalesce_s: float = 0.2):
+        self.path = path
+        self.on_written = on_written
+        self.coalesce_s = coalesce_s
+        self._cond = threading.Condition()
+        self._io = threading.Lock()
+        self._pending: Dict[Path, Note] = {}
+        self._fh = None
+        self._thread: Optional[threading.Thread] = None
+        self.captured = 0
+        self.materialized = 0
+        self.replayed = 0
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        for note in self._read():
+            if not note.path.exists():  # files are written atomically, so existing ones are complete
+                self._pending[note.path] = note
+        self.replayed = len(self._pending)
+        self._fh = self.path.open("a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="capture-journal", daemon=True)
+        self._thread.start()
+
+    def capture(self, notes_dir: Path, title: str, body: str) -> Note:
+        note = plan_new_note(notes_dir, title, body)
+        line = json.dumps({"path": str(note.path), "id": note.meta.note_id, "title": note.meta.title,
+                           "created": note.meta.created, "body": note.body}, ensure_ascii=False)
+        with self._cond:
+            self._fh.write(line + "\n")
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._pending[note.path] = note
+            self.captured += 1
+            self._cond.notify_all()
+        return note
+
+    def is_pending(self, path: Path) -> bool:
+        with self._cond:
+            return path in self._pending
+
+    def flush(self, path: Optional[Path] = None) -> bool:
+        # Write one pending note (or all of them) right now; True if anything
+        # was written. Used when a page is asked for a note not yet on disk.
+        with self._cond:
+            if path is None:
+                batch = list(self._pending.values())
+            else:
+                batch = [self._pending[path]] if path in self._pending else []
+        return bool(batch) and bool(self._materialize(batch))
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending, timeout)
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "captured": self.captured,
+                "materialized": self.materialized,
+                "replayed": self.replayed,
+                "last_error": self.last_error,
+            }
+
+    def _read(self) -> List[Note]:
+        notes = []
+        try:
+            # not splitlines(): bodies may hold U+2028/U+2029/U+0085, which
+            # json.dumps(ensure_ascii=False) leaves unescaped
+            lines = self.path.read_text(encoding="utf-8").split("\n")
+        except FileNotFoundError:
+            return notes
+        for line in lines:
+            try:
+                e = json.loads(line)
+            except ValueError:
+                continue  # torn final line from a crash mid-append
+            meta = NoteMeta(note_id=e["id"], title=e["title"], created=e["created"], updated=e["created"])
+            notes.append(Note(path=Path(e["path"]), meta=meta, body=e["body"]))
+        return notes
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+            time.sleep(self.coalesce_s)
+            with self._cond:
+                batch = list(self._pending.values())
+            if not self._materialize(batch) and self.last_error:
+                time.sleep(1.0)  # disk trouble; keep entries journaled and retry
+
+    def _materialize(self, batch: List[Note]) -> List[Path]:
+        written = []
+        with self._io:
+            try:
+                for note in batch:
+                    with self._cond:
+                        if note.path not in self._pending:
+                            continue  # flushed by another caller meanwhile
+                    write_note(note)
+                    written.append(note.path)
+                    with self._cond:
+                        self._pending.pop(note.path, None)
+                        self.materialized += 1
+                self.last_error = None
+            except OSError as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+            with self._cond:
+                if not self._pending:
+                    self._fh.truncate(0)
+                self._cond.notify_all()
+        if written:
+            self.on_written(written)
+        return written
@@ -0,0 +1,182 @@
+from __future__ import annotations
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import sys
+import threading
+import time
+
+PREFIX = "fireforget_"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 120.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# a collector returns (name, type, help, [(labels, value), ...]) tuples
+Sample = Tuple[str, str, str, List[Tuple[dict, float]]]
+
+def _labels(kw: dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in kw.items()))
+
+def _fmt_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = [f'{k}="{v}"'.replace("\n", " ") for k, v in labels]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _fmt(v: float) -> str:
+    return repr(float(v)) if v != int(v) or abs(v) >= 1e15 else str(int(v))
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.sum += v
+
+# Minimal Prometheus-style registry: counters and histograms are recorded
+# in-process by the hot paths, gauges come from collectors that are asked
+# for their values at scrape time.
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._hists: Dict[Tuple[str, Labels], _Histogram] = {}
+        self._collectors: Dict[str, Callable[[], List[Sample]]] = {}
+
+    def describe(self, name: str, kind: str, help: str) -> None:
+        self._help[name] = (kind, help)
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = _Histogram(buckets)
+            h.observe(value)
+
+    @contextmanager
+    def timed(self, name: str, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def set_collector(self, key: str, fn: Callable[[], List[Sample]]) -> None:
+        # keyed so a re-created app replaces its collector instead of adding one
+        self._collectors[key] = fn
+
+    def render(self) -> str:
+        out: List[str] = []
+
+        def header(name: str, kind: str, help: str = "") -> None:
+            out.append(f"# HELP {PREFIX}{name} {help or self._help.get(name, ('', name))[1]}")
+            out.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            hists = sorted(((k, (list(h.buckets), list(h.counts), h.sum)) for k, h in self._hists.items()),
+                           key=lambda x: x[0])
+        last = None
+        for (name, labels), v in counters:
+            if name != last:
+                header(name, "counter")
+                last = name
+            out.append(f"{PREFIX}{name}{_fmt_labels(labels)} {_fmt(v)}")
+        for (name, labels), (buckets, counts, total) in hists:
+            if name != last:
+                header(name, "histogram")
+                last = name
+            acc = 0
+            for le, n in zip(buckets + [float("inf")], counts):
+                acc += n
+                bound = "+Inf" if le == float("inf") else _fmt(le)
+                out.append(f"{PREFIX}{name}_bucket{_fmt_labels(labels + (('le', bound),))} {acc}")
+            out.append(f"{PREFIX}{name}_sum{_fmt_labels(labels)} {_fmt(round(total, 6))}")
+            out.append(f"{PREFIX}{name}_count{_fmt_labels(labels)} {acc}")
+        for fn in list(self._collectors.values()):
+            try:
+                samples = fn()
+            except Exception:
+                continue
+            for name, kind, help, values in samples:
+                header(name, kind, help)
+                for labels, v in values:
+                    if v is not None:
+                        out.append(f"{PREFIX}{name}{_fmt_labels(_labels(labels))} {_fmt(v)}")
+        return "\n".join(out) + "\n"
+
+METRICS = Metrics()
+METRICS.describe("http_request_duration_seconds", "histogram", "Request latency by route, method and status.")
+METRICS.describe("http_slow_requests_total", "counter", "Requests slower than slow_request_ms.")
+METRICS.describe("index_build_phase_seconds", "histogram", "Duration of each index build phase.")
+METRICS.describe("index_build_seconds", "histogram", "Wall time of whole index builds by kind.")
+METRICS.describe("index_builds_total", "counter", "Index builds by kind (full, incremental) and outcome.")
+METRICS.describe("index_shards_written_total", "counter", "Index shard directories written by saves.")
+METRICS.describe("search_phase_seconds", "histogram", "Search time by phase (embed, rank).")
+METRICS.describe("note_io_seconds", "histogram", "Note storage operations (list, load, write).")
+
+# Samples the stacks of a request's threads every `interval` seconds via
+# sys._current_frames and counts folded stacks ("thread;a;b;c N"), the
+# input format of flamegraph tools. It starts with the calling thread;
+# jobs wrapped with follow() add the thread that runs them (e.g. the
+# search pool) for as long as they run.
+class StackSampler:
+    def __init__(self, thread_id: int, interval: float = 0.002):
+        self.threads: Dict[int, str] = {thread_id: threading.current_thread().name}
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "StackSampler":
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def follow(self, fn: Callable) -> Callable:
+        def run(*args, **kwargs):
+            tid = threading.get_ident()
+            with self._lock:
+                self.threads[tid] = threading.current_thread().name
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.threads.pop(tid, None)
+        return run
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        lines = [f"# {self.samples} samples every {self.interval * 1000:g} ms"]
+        lines += [f"{stack} {n}" for stack, n in self.stacks.most_common()]
+        return "\n".join(lines) + "\n"
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = list(self.threads.items())
+            for tid, tname in threads:
+                frame = frames.get(tid)
+                if frame is None:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                names.append(tname)
+                self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
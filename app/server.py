@@ -0,0 +1,219 @@
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+import threading
+import time
+
+from werkzeug.serving import BaseWSGIServer
+
+from .config import AppConfig
+
+try:
+    from waitress.adjustments import Adjustments
+    from waitress.server import TcpWSGIServer as _waitress_server
+    from waitress.task import ThreadedTaskDispatcher
+except ImportError:  # fall back to a pooled werkzeug server
+    _waitress_server = None
+    ThreadedTaskDispatcher = object
+
+class Overloaded(Exception):
+    pass
+
+# Thread pool that refuses work instead of queueing without bound: at most
+# `workers` jobs run and `queue` more wait, anything beyond that raises
+# Overloaded so the route can answer 503 straight away.
+class BoundedExecutor:
+    def __init__(self, workers: int, queue: int, name: str = "pool"):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max(1, workers) + max(0, queue))
+        self.rejected = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise Overloaded("too many requests in flight")
+        try:
+            fut = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _: self._slots.release())
+        return fut
+
+    def run(self, fn: Callable, *args, **kwargs):
+        return self.submit(fn, *args, **kwargs).result()
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
+
+# Requests over the in-flight limit are not queued for a worker thread;
+# they are serviced on one separate thread with this flag set, and
+# Admission answers them with a 503 without running the app.
+_overflow = threading.local()
+
+def _service_rejected(fn: Callable, *args) -> None:
+    _overflow.active = True
+    try:
+        fn(*args)
+    finally:
+        _overflow.active = False
+
+# WSGI middleware that answers overflow requests (see above) with 503, turns
+# new requests away while the server drains for shutdown, and counts the
+# requests being handled so a drain can wait for them.
+class Admission:
+    def __init__(self, app):
+        self.app = app
+        self.inflight = 0
+        self.rejected = 0
+        self.draining = False
+        self._cond = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        with self._cond:
+            busy = self.draining or getattr(_overflow, "active", False)
+            if busy:
+                self.rejected += 1
+            else:
+                self.inflight += 1
+        if busy:
+            start_response("503 Service Unavailable", [("Content-Type", "text/plain; charset=utf-8"),
+                                                       ("Retry-After", "1")])
+            return [b"Server busy, try again shortly.\n"]
+        try:
+            return self.app(environ, start_response)
+        finally:
+            with self._cond:
+                self.inflight -= 1
+                self._cond.notify_all()
+
+    def drain(self, timeout: float) -> bool:
+        with self._cond:
+            self.draining = True
+            return self._cond.wait_for(lambda: self.inflight == 0, timeout)
+
+class _AdmittingDispatcher(ThreadedTaskDispatcher):
+    # waitress hands every fully received request to its task queue; this
+    # counts queued plus running tasks there, before any worker thread is
+    # involved, and sends requests past `limit` to the reject thread.
+    def __init__(self, threads: int, limit: int):
+        super().__init__()
+        self.limit = limit
+        self.reject_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="http-reject")
+        self.set_thread_count(threads)
+
+    def add_task(self, task) -> None:
+        with self.lock:
+            busy = len(self.queue) + self.active_count >= self.limit
+        if busy:
+            self.reject_pool.submit(_service_rejected, task.service)
+        else:
+            super().add_task(task)
+
+class _PooledWSGIServer(BaseWSGIServer):
+    # werkzeug's server, but requests run on a fixed pool instead of a
+    # thread per connection; past `limit` queued plus running requests they
+    # go to the reject thread instead of waiting in the pool's queue
+    def __init__(self, host: str, port: int, app, threads: int, limit: int):
+        super().__init__(host, port, app)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+        self.reject_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="http-reject")
+        self.limit = limit
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            busy = self.pending >= self.limit
+            if not busy:
+                self.pending += 1
+        if busy:
+            self.reject_pool.submit(_service_rejected, self._handle, request, client_address, False)
+        else:
+            self.pool.submit(self._handle, request, client_address, True)
+
+    def _handle(self, request, client_address, counted: bool):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            if counted:
+                with self._lock:
+                    self.pending -= 1
+
+class Server:
+    def __init__(self, app, cfg: AppConfig):
+        self.app = app
+        self.cfg = cfg
+        self.admission = Admission(app.wsgi_app)
+        app.wsgi_app = self.admission
+        app.extensions["server"] = self
+        # every worker thread can always be busy, so the limit is never below the pool size
+        self.max_inflight = max(cfg.server_max_inflight, cfg.server_threads)
+        self.backend = "waitress" if cfg.server == "waitress" and _waitress_server is not None else "werkzeug"
+        if self.backend == "waitress":
+            adj = Adjustments(host=cfg.host, port=cfg.port, threads=cfg.server_threads,
+                              connection_limit=max(100, 2 * self.max_inflight), channel_timeout=30, ident="fireforget")
+            self._srv = _waitress_server(app, dispatcher=_AdmittingDispatcher(cfg.server_threads, self.max_inflight),
+                                         adj=adj)
+        else:
+            self._srv = _PooledWSGIServer(cfg.host, cfg.port, app, cfg.server_threads, self.max_inflight)
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        run = self._srv.run if self.backend == "waitress" else self._srv.serve_forever
+        self._thread = threading.Thread(target=run, name="http-server", daemon=True)
+        self._thread.start()
+
+    def wait(self) -> None:
+        # Block the calling thread until stop(); Ctrl+C drains gracefully.
+        try:
+            while not self._stopped.wait(0.5):
+                pass
+        except KeyboardInterrupt:
+            self.stop()
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        if self._stopped.is_set():
+            return True
+        t0 = time.monotonic()
+        drained = self.admission.drain(self.cfg.drain_seconds if timeout is None else timeout)
+        for hook in self.app.extensions.get("shutdown_hooks", []):
+            try:
+                hook()
+            except Exception:
+                pass
+        remaining = lambda: max(0.1, self.cfg.drain_seconds - (time.monotonic() - t0))
+        if self.backend == "waitress":
+            # stop accepting, let running tasks finish and open channels flush
+            # their responses, then close the listener and trigger
+            self._srv.accepting = False
+            self._srv.task_dispatcher.shutdown(timeout=remaining())
+            self._srv.task_dispatcher.reject_pool.shutdown(wait=True)
+            deadline = time.monotonic() + remaining()
+            while time.monotonic() < deadline and any(
+                    ch.total_outbufs_len for ch in list(self._srv.active_channels.values())):
+                time.sleep(0.02)
+            # closed from the loop thread, which may be sitting in select() on the socket
+            self._srv.trigger.pull_trigger(self._srv.close)
+            self._thread.join(timeout=1.0)
+        else:
+            self._srv.shutdown()
+            self._srv.pool.shutdown(wait=True)
+            self._srv.reject_pool.shutdown(wait=True)
+            self._srv.server_close()
+        self._stopped.set()
+        return drained
+
+    def status(self) -> dict:
+        return {"backend": self.backend, "threads": self.cfg.server_threads, "max_inflight": self.max_inflight,
+                "inflight": self.admission.inflight,
+                "rejected": self.admission.rejected, "draining": self.admission.draining}
+
+def serve(app, cfg: AppConfig) -> Server:
+    server = Server(app, cfg)
+    server.start()
+    return server
@@ -1,10 +1,13 @@
 from __future__ import annotations
+import hashlib
 import re
 import uuid
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Iterable, Optional, Tuple, Union
+
+from .metrics import METRICS
 
 HEADER_RE = re.compile(r"(?s)\A---\n(.*?)\n---\n(.*)\Z")
 KV_RE = re.compile(r"^([A-Za-z0-9_\-]+):\s*(.*)\s*$")
@@ -41,18 +44,28 @@ def _normalize_newlines(text: str) -> str:
     return text.replace("\r\n", "\n").replace("\r", "\n")
 
 def load_note(path: Path) -> Note:
-    txt = path.read_text(encoding="utf-8", errors="replace")
+    with METRICS.timed("note_io_seconds", op="load"):
+        return _load_note(path)
+
+def _split_header(txt: str) -> Optional[Tuple[dict, str]]:
     m = HEADER_RE.match(txt)
     if not m:
-        now = _now_iso()
-        meta = NoteMeta(note_id=path.stem, title=path.stem, created=now, updated=now)
-        return Note(path=path, meta=meta, body=txt)
-    header_txt, body = m.group(1), _normalize_newlines(m.group(2))
+        return None
     kv = {}
-    for line in header_txt.splitlines():
+    for line in m.group(1).splitlines():
         km = KV_RE.match(line.strip())
         if km:
             kv[km.group(1).strip()] = km.group(2).strip()
+    return kv, _normalize_newlines(m.group(2))
+
+def _load_note(path: Path) -> Note:
+    txt = path.read_text(encoding="utf-8", errors="replace")
+    parsed = _split_header(txt)
+    if parsed is None:
+        now = _now_iso()
+        meta = NoteMeta(note_id=path.stem, title=path.stem, created=now, updated=now)
+        return Note(path=path, meta=meta, body=txt)
+    kv, body = parsed
     note_id = kv.get("id") or path.stem
     title = kv.get("title") or path.stem
     created = kv.get("created") or _now_iso()
@@ -64,20 +77,92 @@ def _safe_title_to_slug(title: str) -> str:
     slug = re.sub(r"[^A-Za-z0-9]+", "-", title).strip("-").lower()
     return slug[:60] or "note"
 
-def save_new_note(notes_dir: Path, title: str, body: str) -> Note:
-    now = _now_iso()
-    yyyy = now[:4]
-    mm = now[5:7]
+def _note_path(notes_dir: Path, created: str, title: str, note_id: str) -> Path:
+    yyyy = created[:4]
+    mm = created[5:7]
     folder = notes_dir / yyyy / f"{yyyy}-{mm}"
-    folder.mkdir(parents=True, exist_ok=True)
+    return folder / f"{created.replace(':','-')}_{_safe_title_to_slug(title)}_{note_id}.md"
+
+def plan_new_note(notes_dir: Path, title: str, body: str) -> Note:
+    # Decide id, timestamps and path for a new note without touching disk.
+    now = _now_iso()
     note_id = uuid.uuid4().hex[:10]
-    slug = _safe_title_to_slug(title)
-    filename = f"{now.replace(':','-')}_{slug}_{note_id}.md"
-    path = folder / filename
     meta = NoteMeta(note_id=note_id, title=title, created=now, updated=now)
+    return Note(path=_note_path(notes_dir, now, title, note_id), meta=meta, body=_normalize_newlines(body))
+
+TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d",
+                     "%d.%m.%Y %H:%M", "%d.%m.%Y", "%Y%m%d%H%M%S", "%Y%m%d")
+CREATED_KEYS = ("created", "date", "created_at", "creation_date", "ctime")
+UPDATED_KEYS = ("updated", "modified", "updated_at", "last_modified", "mtime")
+
+def normalize_timestamp(value: Union[str, int, float, None]) -> Optional[str]:
+    # Timestamps as other tools write them (ISO with or without zone, common
+    # date formats, epoch seconds or milliseconds) -> our local
+    # "YYYY-MM-DDTHH:MM:SS", or None if it can't be read.
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        dt = datetime.fromtimestamp(value / 1000 if value > 1e11 else value)
+    else:
+        v = value.strip().strip("\"'")
+        try:
+            dt = datetime.fromisoformat(v[:-1] + "+00:00" if v.endswith("Z") else v)
+        except ValueError:
+            for fmt in TIMESTAMP_FORMATS:
+                try:
+                    dt = datetime.strptime(v, fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return dt.replace(microsecond=0).isoformat()
+
+def plan_imported_note(notes_dir: Path, title: str, body: str, created=None, updated=None,
+                       note_id: Optional[str] = None) -> Note:
+    # A note brought in from another tool: timestamps are normalised (a
+    # missing created becomes now) and the path is in the month folder of its
+    # creation date. Without an id one is derived from title and body only,
+    # so the same note gets the same id on every import (see note_ids).
+    created = normalize_timestamp(created) or _now_iso()
+    updated = normalize_timestamp(updated) or created
+    title = " ".join(str(title or "").split()) or "Untitled"
     body = _normalize_newlines(body)
-    path.write_text(_render(meta, body), encoding="utf-8")
-    return Note(path=path, meta=meta, body=body)
+    note_id = re.sub(r"[^A-Za-z0-9-]", "", str(note_id or ""))[:32] or \
+        hashlib.sha1(f"{title}\n{body}".encode("utf-8")).hexdigest()[:10]
+    meta = NoteMeta(note_id=note_id, title=title, created=created, updated=updated)
+    return Note(path=_note_path(notes_dir, created, title, note_id), meta=meta, body=body)
+
+def plan_imported_markdown(notes_dir: Path, text: str, name: str, mtime: Optional[float] = None) -> Note:
+    # Markdown file from another tool. Its frontmatter, if any, supplies
+    # title, id and timestamps (under the usual key names); other keys are
+    # dropped. The title falls back to the first "# " heading, then the file
+    # name; created falls back to the file's mtime.
+    text = _normalize_newlines(text.lstrip("\ufeff"))
+    kv, body = _split_header(text) or ({}, text)
+    kv = {k.lower(): v.strip("\"'") for k, v in kv.items()}
+    heading = re.match(r"\s*# (.+)", body)
+    title = kv.get("title") or (heading.group(1).strip() if heading else "") or Path(name).stem
+    created = normalize_timestamp(next((kv[k] for k in CREATED_KEYS if kv.get(k)), None)) or mtime
+    updated = next((kv[k] for k in UPDATED_KEYS if kv.get(k)), None)
+    return plan_imported_note(notes_dir, title, body, created, updated, kv.get("id"))
+
+def write_note(note: Note) -> None:
+    with METRICS.timed("note_io_seconds", op="write"):
+        _write_note(note)
+
+def _write_note(note: Note) -> None:
+    note.path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = note.path.with_name(note.path.name + ".tmp")
+    tmp.write_text(_render(note.meta, note.body), encoding="utf-8")
+    tmp.replace(note.path)
+
+def save_new_note(notes_dir: Path, title: str, body: str) -> Note:
+    note = plan_new_note(notes_dir, title, body)
+    write_note(note)
+    return note
 
 def update_note(path: Path, title: str, body: str) -> Note:
     note = load_note(path)
@@ -90,6 +175,11 @@ def update_note(path: Path, title: str, body: str) -> Note:
 def delete_note(path: Path) -> None:
     path.unlink(missing_ok=True)
 
+def note_ids(notes_dir: Path) -> set:
+    # ids of the notes on disk, from the "<created>_<slug>_<id>.md" file names
+    return {p.stem.rsplit("_", 1)[-1] for p in notes_dir.glob("**/*.md")}
+
 def list_notes(notes_dir: Path) -> Iterable[Path]:
-    paths = sorted(notes_dir.glob("**/*.md"), key=lambda p: p.stat().st_mtime, reverse=True)
+    with METRICS.timed("note_io_seconds", op="list"):
+        paths = sorted(notes_dir.glob("**/*.md"), key=lambda p: p.stat().st_mtime, reverse=True)
     return paths
@@ -0,0 +1,184 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Optional
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from .catalog import scan_notes
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+
+# Watches notes_dir for changes made outside the app (editors, git, sync
+# tools). Events are debounced: a batch is delivered once the tree has been
+# quiet for `debounce_s`, or after `max_delay_s` during a long burst, so a
+# checkout of thousands of files becomes one callback. The callback receives
+# the changed .md paths and a `rescan` flag for when individual paths are
+# unknown (inotify queue overflow, a directory moved or deleted).
+class NotesWatcher:
+    def __init__(self, notes_dir: Path, on_batch: Callable[[set, bool], None],
+                 debounce_s: float = 0.5, max_delay_s: float = 5.0, poll_s: float = 2.0,
+                 use_inotify: bool = True):
+        self.notes_dir = notes_dir
+        self.on_batch = on_batch
+        self.debounce_s = debounce_s
+        self.max_delay_s = max_delay_s
+        self.poll_s = poll_s
+        self.use_inotify = use_inotify
+        self.backend: Optional[str] = None
+        self.batches = 0
+        self._pending: set = set()
+        self._rescan = False
+        self._first_at = 0.0
+        self._last_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        run = self._run_poll
+        if self.use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._inotify_init()
+                run = self._run_inotify
+            except OSError:
+                pass
+        self.backend = "inotify" if run == self._run_inotify else "poll"
+        self._thread = threading.Thread(target=run, name="notes-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _note(self, path: Optional[Path] = None, rescan: bool = False) -> None:
+        now = time.monotonic()
+        if not self._pending and not self._rescan:
+            self._first_at = now
+        self._last_at = now
+        if path is not None:
+            self._pending.add(path)
+        self._rescan = self._rescan or rescan
+
+    def _maybe_flush(self) -> None:
+        if not self._pending and not self._rescan:
+            return
+        now = time.monotonic()
+        if now - self._last_at < self.debounce_s and now - self._first_at < self.max_delay_s:
+            return
+        batch, rescan = self._pending, self._rescan
+        self._pending, self._rescan = set(), False
+        self.batches += 1
+        try:
+            self.on_batch(batch, rescan)
+        except Exception:
+            pass  # keep watching; the next batch or a rescan will catch up
+
+    # -- polling backend -------------------------------------------------
+
+    def _run_poll(self) -> None:
+        seen = scan_notes(self.notes_dir)
+        next_scan = time.monotonic() + self.poll_s
+        while not self._stop.wait(min(self.debounce_s, self.poll_s) / 2):
+            if time.monotonic() >= next_scan:
+                now = scan_notes(self.notes_dir)
+                for p, stamp in now.items():
+                    if seen.get(p) != stamp:
+                        self._note(Path(p))
+                for p in seen.keys() - now.keys():
+                    self._note(Path(p))
+                seen = now
+                next_scan = time.monotonic() + self.poll_s
+            self._maybe_flush()
+
+    # -- inotify backend (Linux) -----------------------------------------
+
+    def _inotify_init(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._libc = libc
+        self._fd = fd
+        self._wds: dict = {}
+        self._add_tree(self.notes_dir)
+
+    def _add_watch(self, d: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(str(d)), WATCH_MASK)
+        if wd >= 0:
+            self._wds[wd] = d
+
+    def _add_tree(self, root: Path) -> None:
+        self._add_watch(root)
+        for dirpath, dirnames, _ in os.walk(root):
+            for name in dirnames:
+                self._add_watch(Path(dirpath) / name)
+
+    def _run_inotify(self) -> None:
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([self._fd], [], [], self.debounce_s / 2)
+                if ready:
+                    try:
+                        buf = os.read(self._fd, 64 * 1024)
+                    except BlockingIOError:
+                        buf = b""
+                    self._parse(buf)
+                self._maybe_flush()
+        finally:
+            os.close(self._fd)
+
+    def _parse(self, buf: bytes) -> None:
+        off = 0
+        while off + EVENT_HEADER.size <= len(buf):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(buf, off)
+            raw = buf[off + EVENT_HEADER.size:off + EVENT_HEADER.size + length]
+            off += EVENT_HEADER.size + length
+            name = os.fsdecode(raw.rstrip(b"\0"))
+            if mask & IN_Q_OVERFLOW:
+                self._note(rescan=True)
+                continue
+            if mask & IN_IGNORED:
+                self._wds.pop(wd, None)
+                continue
+            d = self._wds.get(wd)
+            if d is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if d != self.notes_dir:
+                    self._note(rescan=True)
+                continue
+            path = d / name if name else d
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # files may already be inside (mkdir -p + copy, or a move)
+                    self._add_tree(path)
+                    for p in scan_notes(path):
+                        self._note(Path(p))
+                elif mask & IN_MOVED_FROM:
+                    self._note(rescan=True)
+                continue
+            if name.endswith(".md"):
+                self._note(path)
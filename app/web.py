@@ -1,37 +1,170 @@
 from __future__ import annotations
 from pathlib import Path
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, session, g
 import html
 import re
+import threading
+import time
 import uuid
 
 from .config import AppConfig
-from .storage import load_note, save_new_note, update_note, delete_note, list_notes
-from .indexer import build_index, load_index, save_index, search
-from .tasks import extract_tasks, TaskItem, toggle_complete_in_file
+from .storage import load_note, update_note, delete_note
+from .cache import LRUCache, QueryCache
+from .httpcache import IMMUTABLE_MAX_AGE, conditional, file_etag, file_last_modified, install_compression, not_modified
+from .worker import IndexWorker
+from .catalog import Catalog
+from .watcher import NotesWatcher
+from .journal import CaptureJournal
+from .server import BoundedExecutor, Overloaded
+from .images import ImageStore
+from .importer import ImportJob
+from .indexer import index_disk_bytes
+from .metrics import METRICS, StackSampler
+from .tasks import TaskItem, toggle_complete_in_file
 
 def create_app(cfg: AppConfig) -> Flask:
     templates_dir = str(Path(__file__).resolve().parent.parent / "templates")
     app = Flask(__name__, template_folder=templates_dir)
     app.secret_key = "fireforget-local-only"
-    images_dir = (cfg.base_dir / "data" / "images").resolve()
+    images_dir = (cfg.data_dir / "images").resolve()
     images_dir.mkdir(parents=True, exist_ok=True)
+    images = ImageStore(images_dir)
+    images.start()
+    app.extensions["images"] = images
     img_re = re.compile(r"!\[(?P<alt>[^\]]*)\]\((?P<url>/images/[^\)]+)\)")
 
-    def _reindex():
-        notes = []
-        for p in list_notes(cfg.notes_dir):
-            n = load_note(p)
-            notes.append({"id": n.meta.note_id, "path": p, "title": n.meta.title, "created": n.meta.created, "body": n.body})
-        idx = build_index(notes)
-        save_index(idx, cfg.index_path)
-        return idx
+    worker = IndexWorker(cfg)
+    worker.start()
+    app.extensions["index_worker"] = worker
+    catalog = Catalog(cfg.data_dir / "catalog.sqlite3", cfg.notes_dir)
+
+    def _startup_sync() -> None:
+        # Notes edited while the app was closed (git pull, sync tools) go to
+        # the index too. A fresh catalog sees every note as changed; the
+        # worker's startup build already covers that case.
+        fresh = not catalog.count()
+        changed, removed = catalog.sync()
+        if not fresh and (changed or removed):
+            worker.enqueue(changed + removed)
+
+    threading.Thread(target=_startup_sync, name="catalog-sync", daemon=True).start()
+    app.extensions["catalog"] = catalog
+    browse_page_size = 50
+    probes = cfg.ann_probes if cfg.ann else None
+    per_note = cfg.search_per_note or None
+    query_cache = QueryCache()
+    app.extensions["query_cache"] = query_cache
+    search_pool = BoundedExecutor(cfg.search_threads, cfg.search_queue, name="search")
+    app.extensions["search_pool"] = search_pool
+    rendered_notes = LRUCache(256)  # (path, mtime_ns, size, images ready) -> (note, rendered body)
+    note_images = LRUCache(1024)  # (path, mtime_ns, size) -> image names the note references
+    # registered before compression so the timing includes it (after_request runs in reverse)
+    @app.before_request
+    def _start_request():
+        g.t0 = time.perf_counter()
+        if cfg.profile_requests and request.args.get("_profile"):
+            g.sampler = StackSampler(threading.get_ident()).start()
+
+    @app.after_request
+    def _finish_request(resp):
+        sampler = g.pop("sampler", None)
+        if sampler is not None:
+            resp = app.response_class(sampler.stop(), mimetype="text/plain")
+        dt = time.perf_counter() - g.get("t0", time.perf_counter())
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        METRICS.observe("http_request_duration_seconds", dt, route=route, method=request.method,
+                        status=resp.status_code)
+        if cfg.slow_request_ms and dt * 1000 >= cfg.slow_request_ms:
+            METRICS.inc("http_slow_requests_total", route=route)
+            app.logger.warning("slow request: %s %s -> %d in %.1f ms", request.method, request.full_path.rstrip("?"),
+                               resp.status_code, dt * 1000)
+        return resp
+
+    install_compression(app)
+
+    @app.context_processor
+    def _nav_counts():
+        if not catalog.ready.is_set():
+            return {"open_tasks": None}
+        return {"open_tasks": catalog.task_counts()["not_completed"]}
+
+    def _notes_changed(paths: list[Path]) -> None:
+        catalog.refresh(paths)
+        worker.enqueue(paths)
+
+    def _external_changes(paths: set, rescan: bool) -> None:
+        # Our own writes show up here too; the catalog filters out files whose
+        # content it already has, so only real external edits get reindexed.
+        catalog.ready.wait()
+        if rescan:
+            changed, removed = catalog.sync()
+            dirty = changed + removed
+        else:
+            dirty = catalog.refresh(paths)
+        if dirty:
+            worker.enqueue(dirty)
+
+    journal = CaptureJournal(cfg.data_dir / "capture.journal", _notes_changed)
+    journal.start()
+    app.extensions["capture_journal"] = journal
+
+    if cfg.watch_notes:
+        watcher = NotesWatcher(cfg.notes_dir, _external_changes, poll_s=cfg.watch_poll_seconds)
+        watcher.start()
+        app.extensions["notes_watcher"] = watcher
+    # run by the server once in-flight requests have drained
+    app.extensions["shutdown_hooks"] = [journal.flush, search_pool.shutdown] + ([watcher.stop] if cfg.watch_notes else [])
+
+    def _collect_metrics() -> list:
+        st = worker.status()
+        idx = worker.resident.current
+        caches = {"query_results": query_cache.stats()["results"], "query_vectors": query_cache.stats()["vectors"],
+                  "rendered_notes": rendered_notes.stats()}
+        out = [
+            ("index_chunks", "gauge", "Chunks in the resident index.", [({}, st["chunks"])]),
+            ("index_notes", "gauge", "Notes in the resident index.",
+             [({}, len(idx.chunks.note_paths) if idx is not None else 0)]),
+            ("index_generation", "gauge", "Published index generation.", [({}, st["generation"])]),
+            ("index_disk_bytes", "gauge", "Size of the current on-disk index version.",
+             [({}, index_disk_bytes(cfg.index_path))]),
+            ("index_queue_depth", "gauge", "Dirty notes waiting for the index worker.", [({}, st["queue_depth"])]),
+            ("cache_hits_total", "counter", "Cache hits by cache.",
+             [({"cache": k}, v["hits"]) for k, v in caches.items()]),
+            ("cache_misses_total", "counter", "Cache misses by cache.",
+             [({"cache": k}, v["misses"]) for k, v in caches.items()]),
+            ("cache_entries", "gauge", "Entries held by cache.",
+             [({"cache": k}, v["entries"]) for k, v in caches.items()]),
+            ("capture_pending", "gauge", "Journaled captures not yet written to disk.",
+             [({}, journal.status()["pending"])]),
+            ("search_rejected_total", "counter", "Searches refused because the search pool was full.",
+             [({}, search_pool.rejected)]),
+        ]
+        server = app.extensions.get("server")
+        if server is not None:
+            ss = server.status()
+            out.append(("http_inflight", "gauge", "Requests being handled.", [({}, ss["inflight"])]))
+            out.append(("http_rejected_total", "counter", "Requests refused with 503.", [({}, ss["rejected"])]))
+        return out
 
-    def _get_index():
-        idx = load_index(cfg.index_path)
+    METRICS.set_collector("app", _collect_metrics)
+
+    @app.errorhandler(Overloaded)
+    def _overloaded(e):
+        if request.path.startswith("/api/"):
+            resp = jsonify({"error": "search is busy, try again shortly"})
+        else:
+            resp = app.make_response("Search is busy, try again shortly.")
+        resp.status_code = 503
+        resp.headers["Retry-After"] = "1"
+        return resp
+
+    def _search(queries: list, **kw) -> list:
+        idx = worker.snapshot()
         if idx is None:
-            idx = _reindex()
-        return idx
+            return [[] for _ in queries]
+        sampler = g.get("sampler")
+        fn = query_cache.search if sampler is None else sampler.follow(query_cache.search)
+        return search_pool.run(fn, idx, queries, probes=probes, **kw)
 
     def _is_under_notes_dir(p: Path) -> bool:
         try:
@@ -53,7 +186,14 @@ def create_app(cfg: AppConfig) -> Flask:
         def _img_repl(m: re.Match) -> str:
             alt = html.escape(m.group("alt"))
             url = m.group("url")
-            tokens.append(f'<img src="{url}" alt="{alt}" loading="lazy">')
+            name = url[len("/images/"):]
+            srcset = images.srcset(name) if images.valid_name(name) else None
+            if srcset:
+                meta = images.variants(name)
+                tokens.append(f'<img src="{url}" srcset="{html.escape(srcset)}" sizes="(max-width: 1048px) 100vw, 1000px" '
+                              f'width="{meta["width"]}" height="{meta["height"]}" alt="{alt}" loading="lazy" decoding="async">')
+            else:
+                tokens.append(f'<img src="{url}" alt="{alt}" loading="lazy">')
             return f"@@IMG{len(tokens)-1}@@"
 
         text = img_re.sub(_img_repl, body)
@@ -62,6 +202,16 @@ def create_app(cfg: AppConfig) -> Flask:
             text = text.replace(f"@@IMG{i}@@", tag)
         return text.replace("\n", "<br>\n")
 
+    def _note_images(p: Path, st) -> tuple:
+        key = (str(p), st.st_mtime_ns, st.st_size)
+        names = note_images.get(key)
+        if names is None:
+            text = p.read_text(encoding="utf-8", errors="replace")
+            names = tuple(dict.fromkeys(m.group("url")[len("/images/"):] for m in img_re.finditer(text)))
+            names = tuple(n for n in names if images.valid_name(n))
+            note_images.put(key, names)
+        return names
+
     @app.route("/")
     def home():
         return redirect(url_for("browse"))
@@ -71,39 +221,61 @@ def create_app(cfg: AppConfig) -> Flask:
         if request.method == "POST":
             title = request.form.get("title","").strip() or "Untitled"
             body = request.form.get("body","")
-            note = save_new_note(cfg.notes_dir, title, body)
-            _reindex()
+            note = journal.capture(cfg.notes_dir, title, body)
             return redirect(url_for("view_note", path=str(note.path)))
         return render_template("new.html")
 
     @app.route("/browse")
     def browse():
         q = request.args.get("q","").strip().lower()
-        notes = []
-        for p in list_notes(cfg.notes_dir):
-            n = load_note(p)
-            snippet = (n.body.strip().splitlines()[0] if n.body.strip() else "")
-            if q and q not in n.meta.title.lower() and q not in n.body.lower():
-                continue
-            notes.append({
-                "path": str(p),
-                "title": n.meta.title,
-                "created": n.meta.created,
-                "updated": n.meta.updated,
-                "snippet": snippet[:160] + ("…" if len(snippet) > 160 else "")
-            })
-        return render_template("browse.html", notes=notes, q=request.args.get("q",""))
+        try:
+            page = max(1, int(request.args.get("page","1") or 1))
+        except Exception:
+            page = 1
+        offset = (page - 1) * browse_page_size
+        catalog.ready.wait()
+        if not q:
+            notes = catalog.page(offset, browse_page_size + 1)
+        else:
+            notes = []
+            for row in catalog.matching(q):
+                if offset:
+                    offset -= 1
+                    continue
+                notes.append(row)
+                if len(notes) > browse_page_size:
+                    break
+        has_next = len(notes) > browse_page_size
+        return render_template("browse.html", notes=notes[:browse_page_size], q=request.args.get("q",""),
+                               page=page, has_next=has_next, total=None if q else catalog.count())
 
     @app.route("/note")
     def view_note():
         path = request.args.get("path","")
         p = Path(path)
+        if not p.exists() and _is_under_notes_dir(p):
+            journal.flush(p)  # just captured, not written out yet
         if not p.exists() or not _is_under_notes_dir(p):
             flash("Note not found.")
             return redirect(url_for("browse"))
-        n = load_note(p)
-        rendered_body = _render_body(n.body)
-        return render_template("note.html", note=n, rendered_body=rendered_body)
+        st = p.stat()
+        # the page also shows the open-task badge, so its count is part of the tag, and
+        # so is how many of the note's own images have their srcset variants yet
+        ready = images.ready(_note_images(p, st))
+        etag = file_etag(st, _nav_counts()["open_tasks"], ready)
+        last_modified = file_last_modified(st)
+        if "_flashes" not in session and not_modified(etag, last_modified):
+            return conditional(app.response_class(), etag, last_modified)
+        key = (str(p), st.st_mtime_ns, st.st_size, ready)
+        cached = rendered_notes.get(key)
+        if cached is None:
+            n = load_note(p)
+            cached = (n, _render_body(n.body))
+            rendered_notes.put(key, cached)
+        n, rendered_body = cached
+        resp = app.make_response(render_template("note.html", note=n, rendered_body=rendered_body))
+        resp.cache_control.no_cache = True
+        return conditional(resp, etag, last_modified)
 
     @app.route("/note/edit", methods=["GET","POST"])
     def edit_note():
@@ -117,7 +289,7 @@ def create_app(cfg: AppConfig) -> Flask:
             title = request.form.get("title", n.meta.title)
             body = request.form.get("body","")
             update_note(p, title, body)
-            _reindex()
+            _notes_changed([p])
             return redirect(url_for("view_note", path=str(p)))
         return render_template("edit.html", note=n)
 
@@ -129,23 +301,160 @@ def create_app(cfg: AppConfig) -> Flask:
             flash("Note not found.")
             return redirect(url_for("browse"))
         delete_note(p)
-        _reindex()
+        _notes_changed([p])
         flash("Note deleted.")
         return redirect(url_for("browse"))
 
     @app.route("/search")
     def search_page():
         q = request.args.get("q","").strip()
+        date_from = request.args.get("from", "").strip()
+        date_to = request.args.get("to", "").strip()
         results = []
         if q:
-            idx = _get_index()
-            for chunk, score in search(idx, q, top_k=12):
+            hits = _search([q], top_k=cfg.max_results, date_from=date_from or None, date_to=date_to or None,
+                           per_note=per_note)[0]
+            for chunk, score in hits:
                 excerpt = chunk.text.replace("\n"," ").strip()
                 if len(excerpt) > 220:
                     excerpt = excerpt[:220] + "…"
                 results.append({"path": chunk.note_path, "title": chunk.note_title,
                                 "created": chunk.note_created, "excerpt": excerpt, "score": f"{score:.3f}"})
-        return render_template("search.html", q=q, results=results)
+        return render_template("search.html", q=q, date_from=date_from, date_to=date_to, results=results)
+
+    @app.post("/api/search")
+    def api_search():
+        data = request.get_json(silent=True) or {}
+        queries = data.get("queries")
+        if not isinstance(queries, list) or not all(isinstance(x, str) for x in queries):
+            return jsonify({"error": "queries must be a list of strings"}), 400
+        if len(queries) > 1000:
+            return jsonify({"error": "at most 1000 queries per request"}), 400
+        try:
+            top_k = max(1, min(100, int(data.get("top_k", 10))))
+        except Exception:
+            return jsonify({"error": "top_k must be an integer"}), 400
+        try:
+            note_cap = int(data["per_note"]) if data.get("per_note") is not None else per_note
+        except Exception:
+            return jsonify({"error": "per_note must be an integer"}), 400
+        if note_cap is not None and note_cap < 0:
+            return jsonify({"error": "per_note must be 0 (no cap) or more"}), 400
+        date_from = str(data.get("date_from") or "").strip() or None
+        date_to = str(data.get("date_to") or "").strip() or None
+        hits = _search(queries, top_k=top_k, date_from=date_from, date_to=date_to, per_note=note_cap or None)
+        results = []
+        for q, qhits in zip(queries, hits):
+            results.append({"query": q, "hits": [{
+                "path": chunk.note_path,
+                "title": chunk.note_title,
+                "created": chunk.note_created,
+                "chunk_id": chunk.chunk_id,
+                "score": round(score, 4),
+                "excerpt": chunk.text[:300],
+            } for chunk, score in qhits]})
+        return jsonify({"results": results})
+
+    @app.post("/api/capture")
+    def api_capture():
+        data = request.get_json(silent=True) or {}
+        title = str(data.get("title") or "").strip() or "Untitled"
+        body = data.get("body", "")
+        if not isinstance(body, str):
+            return jsonify({"error": "body must be a string"}), 400
+        note = journal.capture(cfg.notes_dir, title, body)
+        return jsonify({"id": note.meta.note_id, "path": str(note.path), "created": note.meta.created}), 202
+
+    imports: dict = {}  # job id -> ImportJob
+    imports_lock = threading.Lock()
+    app.extensions["imports"] = imports
+    import_keep_s = 3600.0  # finished jobs stay pollable this long
+    import_keep_max = 100  # and at most this many of them are kept
+    import_index_wait_s = 600.0
+
+    def _prune_imports() -> None:
+        now = time.time()
+        with imports_lock:
+            done = sorted((j for j in imports.values() if j.finished_at is not None), key=lambda j: j.finished_at)
+            for i, job in enumerate(done):
+                if now - job.finished_at > import_keep_s or len(done) - i > import_keep_max:
+                    del imports[job.id]
+
+    @app.post("/api/import")
+    def api_import():
+        # Body: a zip/tar(.gz) of markdown files or JSON lines, either raw or
+        # as the "file" field of a form. It is spooled to disk in pieces and
+        # imported in the background; index builds wait until it is done.
+        spool_dir = cfg.data_dir / "imports"
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        spool = spool_dir / f"{uuid.uuid4().hex}.upload"
+        name = "upload"
+        if request.mimetype == "multipart/form-data":
+            f = request.files.get("file")
+            if not f:
+                return jsonify({"error": "no file uploaded"}), 400
+            f.save(spool)
+            name = f.filename or name
+        else:
+            with spool.open("wb") as out:
+                while True:
+                    block = request.stream.read(1 << 20)
+                    if not block:
+                        break
+                    out.write(block)
+        if not spool.stat().st_size:
+            spool.unlink()
+            return jsonify({"error": "empty upload"}), 400
+
+        def _imported(paths: list) -> None:
+            spool.unlink(missing_ok=True)
+            worker.resume()
+            # the job reports "indexing" until the build is in; a build that
+            # outlasts the wait is left to finish in the background
+            worker.wait_idle(import_index_wait_s)
+
+        _prune_imports()
+        job = ImportJob(spool, cfg.notes_dir, on_batch=_notes_changed, on_done=_imported, name=name)
+        with imports_lock:
+            imports[job.id] = job
+        worker.pause()
+        threading.Thread(target=job.run, name=f"import-{job.id}", daemon=True).start()
+        return jsonify({**job.status(), "status_url": url_for("import_status", job_id=job.id)}), 202
+
+    @app.get("/api/import/<job_id>")
+    def import_status(job_id: str):
+        _prune_imports()
+        with imports_lock:
+            job = imports.get(job_id)
+        if job is None:
+            return jsonify({"error": "unknown import"}), 404
+        return jsonify(job.status())
+
+    @app.post("/index/rebuild")
+    def rebuild_index():
+        worker.request_rebuild()
+        flash("Search index rebuild started.")
+        return redirect(request.referrer or url_for("search_page"))
+
+    @app.route("/healthz")
+    def healthz():
+        # Answers as soon as the server is up (capture works from then on);
+        # the body says whether search and browse are warmed up yet.
+        st = worker.status()
+        return jsonify({"status": "ok", "index": "ready" if st["warm"] else "warming",
+                        "catalog": "ready" if catalog.ready.is_set() else "syncing",
+                        "capture_pending": journal.status()["pending"]})
+
+    @app.route("/metrics")
+    def metrics():
+        return app.response_class(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.route("/index/status")
+    def index_status():
+        return jsonify({**worker.status(), "query_cache": query_cache.stats(), "capture": journal.status(),
+                        "note_cache": rendered_notes.stats(), "search_rejected": search_pool.rejected,
+                        "images": images.status(),
+                        "server": app.extensions["server"].status() if "server" in app.extensions else None})
 
 
     @app.route("/copilot")
@@ -160,8 +469,7 @@ def create_app(cfg: AppConfig) -> Flask:
         prompt = ""
         sources = []
         if q:
-            idx = _get_index()
-            hits = search(idx, q, top_k=k)
+            hits = _search([q], top_k=k, per_note=per_note)[0]
             # Build sources list (truncate excerpts for prompt)
             lines = []
             for i, (chunk, score) in enumerate(hits, start=1):
@@ -201,23 +509,10 @@ def create_app(cfg: AppConfig) -> Flask:
         status_filter = request.args.get("status","not_completed").strip().lower()
         if status_filter not in {"all", "not_completed", "completed", "created", "in_progress"}:
             status_filter = "not_completed"
-        items: list[TaskItem] = []
-        note_paths = list(reversed(list_notes(cfg.notes_dir)))  # oldest->newest
-        for p in note_paths:
-            n = load_note(p)
-            for line_no, txt, done, status, notes in extract_tasks(n.body):
-                if status_filter == "not_completed" and done:
-                    continue
-                if status_filter == "completed" and not done:
-                    continue
-                if status_filter == "created" and (done or status != "created"):
-                    continue
-                if status_filter == "in_progress" and (done or status != "in_progress"):
-                    continue
-                if q and q not in txt.lower() and q not in n.meta.title.lower():
-                    continue
-                items.append(TaskItem(note_path=p, note_title=n.meta.title, note_created=n.meta.created,
-                                      line_no=line_no, text=txt, done=done, status=status, notes=notes))
+        catalog.ready.wait()
+        items: list[TaskItem] = catalog.tasks(status_filter)
+        if q:
+            items = [t for t in items if q in t.text.lower() or q in t.note_title.lower()]
         return render_template("tasks.html", items=items, q=request.args.get("q",""), status_filter=status_filter)
 
     @app.post("/tasks/complete")
@@ -233,7 +528,7 @@ def create_app(cfg: AppConfig) -> Flask:
             return redirect(url_for("tasks_page"))
         changed = toggle_complete_in_file(p, line_no)
         if changed:
-            _reindex()
+            _notes_changed([p])
         return redirect(request.referrer or url_for("tasks_page"))
 
     @app.route("/images/<path:filename>")
@@ -241,7 +536,11 @@ def create_app(cfg: AppConfig) -> Flask:
         file_path = (images_dir / filename).resolve()
         if not _is_under_images_dir(file_path) or not file_path.exists():
             return ("Not found", 404)
-        return send_from_directory(images_dir, filename)
+        # uploads and thumbnails are named after their content, never rewritten in place
+        resp = send_from_directory(images_dir, filename, max_age=IMMUTABLE_MAX_AGE)
+        resp.cache_control.public = True
+        resp.cache_control.immutable = True
+        return resp
 
     @app.post("/upload")
     def upload_image():
@@ -261,9 +560,7 @@ def create_app(cfg: AppConfig) -> Flask:
         if not ext:
             return jsonify({"error": "Unsupported image type"}), 400
 
-        filename = f"{uuid.uuid4().hex}{ext}"
-        file_path = images_dir / filename
-        f.save(file_path)
-        return jsonify({"url": f"/images/{filename}"})
+        filename, created = images.save(f.read(), ext)
+        return jsonify({"url": f"/images/{filename}", "duplicate": not created})
 
     return app
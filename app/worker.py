@@ -0,0 +1,213 @@
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import replace
+from itertools import repeat
+from pathlib import Path
+from typing import Iterable, List, Optional
+import os
+import threading
+import time
+
+from .config import AppConfig
+from .metrics import METRICS
+from .storage import load_note, list_notes
+from .indexer import (DRIFT_THRESHOLD, Chunk, Index, IndexProfile, ResidentIndex, build_index_from_chunks,
+                      build_index_streaming, note_chunks, load_index, save_index, upsert_notes, remove_notes,
+                      needs_refit, note_vectors, warm_up)
+
+def note_dict(p: Path) -> dict:
+    n = load_note(p)
+    return {"id": n.meta.note_id, "path": p, "title": n.meta.title, "created": n.meta.created, "body": n.body}
+
+def _load_chunks(p: Path, profile: Optional[IndexProfile] = None) -> List[Chunk]:
+    return note_chunks(note_dict(p), profile)
+
+def iter_corpus(paths: List[Path], workers: int = 0, pool: str = "thread", window: int = 0,
+                profile: Optional[IndexProfile] = None) -> Iterable[Chunk]:
+    # Read, parse and chunk notes on a pool. Executor.map yields in input
+    # order, so the chunk order (and thus the fitted index) is stable no
+    # matter how the work was scheduled. A `window` bounds how many notes
+    # are in flight, for callers that stream the result.
+    n = workers or os.cpu_count() or 1
+    if n <= 1 or len(paths) < 2 * n:
+        for p in paths:
+            yield from _load_chunks(p, profile)
+        return
+    executor = ProcessPoolExecutor if pool == "process" else ThreadPoolExecutor
+    step = window or len(paths)
+    with executor(max_workers=n) as ex:
+        for start in range(0, len(paths), step):
+            part = paths[start:start + step]
+            for cs in ex.map(_load_chunks, part, repeat(profile), chunksize=max(1, len(part) // (n * 8))):
+                yield from cs
+
+def load_corpus(paths: List[Path], workers: int = 0, pool: str = "thread",
+                profile: Optional[IndexProfile] = None) -> List[Chunk]:
+    return list(iter_corpus(paths, workers, pool, profile=profile))
+
+def build_full(cfg: AppConfig) -> Index:
+    t0 = time.perf_counter()
+    paths = list(list_notes(cfg.notes_dir))
+    t1 = time.perf_counter()
+    profile = cfg.index_profile()
+    chunks = load_corpus(paths, cfg.index_workers, cfg.index_pool, profile)
+    t2 = time.perf_counter()
+    return build_index_from_chunks(chunks, {"notes": len(paths), "scan_s": round(t1 - t0, 4),
+                                            "load_chunk_s": round(t2 - t1, 4)},
+                                   ann=cfg.ann, ann_min_rows=cfg.ann_min_rows, profile=profile)
+
+def rebuild_on_disk(cfg: AppConfig) -> Index:
+    # Full rebuild that always ends with the new index saved at
+    # cfg.index_path; bounded-memory streaming when index_memory_mb is set.
+    if not cfg.index_memory_mb:
+        idx = build_full(cfg)
+        save_index(idx, cfg.index_path)
+        # reload so chunk texts are served from the mmap'd file, not memory
+        return load_index(cfg.index_path) or idx
+    t0 = time.perf_counter()
+    paths = list(list_notes(cfg.notes_dir))
+    stats = {"notes": len(paths), "scan_s": round(time.perf_counter() - t0, 4)}
+    profile = cfg.index_profile()
+    chunks = iter_corpus(paths, cfg.index_workers, cfg.index_pool, window=256, profile=profile)
+    idx = build_index_streaming(chunks, cfg.index_path, cfg.index_memory_mb, stats, profile)
+    if idx is None:
+        raise RuntimeError("streamed index could not be loaded back")
+    return idx
+
+# Single background thread that owns index builds and index writes. Writers
+# enqueue dirty note paths and a burst of them is coalesced into one build;
+# readers get the last complete snapshot from the resident index.
+class IndexWorker:
+    def __init__(self, cfg: AppConfig, coalesce_s: float = 0.25):
+        self.cfg = cfg
+        self.coalesce_s = coalesce_s
+        self._cond = threading.Condition()
+        self._dirty: set[Path] = set()
+        self._full = False
+        self._busy = False
+        self._holds = 0
+        self.resident = ResidentIndex(cfg.index_path)
+        self._thread: Optional[threading.Thread] = None
+        self.builds = 0
+        self.last_build_s: Optional[float] = None
+        self.last_build_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.warm = False
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="index-worker", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, paths: Iterable[Path]) -> None:
+        with self._cond:
+            self._dirty.update(Path(p) for p in paths)
+            self._cond.notify_all()
+
+    def request_rebuild(self) -> None:
+        with self._cond:
+            self._full = True
+            self._cond.notify_all()
+
+    def pause(self) -> None:
+        # Hold builds (e.g. during a bulk import); changes queued meanwhile
+        # are built together once every pause() has been resumed.
+        with self._cond:
+            self._holds += 1
+
+    def resume(self) -> None:
+        with self._cond:
+            self._holds = max(0, self._holds - 1)
+            self._cond.notify_all()
+
+    def snapshot(self, timeout: Optional[float] = None) -> Optional[Index]:
+        # Only blocks until the first build attempt has finished.
+        idx = self.resident.get()
+        if idx is None:
+            with self._cond:
+                self._cond.wait_for(lambda: self.builds > 0, timeout)
+            idx = self.resident.get()
+        return idx
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self.builds > 0 and not self._busy and not self._dirty and not self._full,
+                timeout)
+
+    def status(self) -> dict:
+        with self._cond:
+            idx = self.resident.current
+            return {
+                "queue_depth": len(self._dirty) + (1 if self._full else 0),
+                "building": self._busy,
+                "paused": self._holds > 0,
+                "ready": idx is not None,
+                "warm": self.warm,
+                "generation": self.resident.generation,
+                "chunks": len(idx.chunks) if idx is not None else 0,
+                "shards": len(idx.shards) if idx is not None else 0,
+                "builds": self.builds,
+                "last_build_seconds": self.last_build_s,
+                "last_build_at": self.last_build_at,
+                "last_full_build": idx.stats if idx is not None else {},
+                "last_error": self.last_error,
+            }
+
+    def _run(self) -> None:
+        with self._cond:
+            self._busy = True
+        self._build(self.resident.get(), None)
+        idx = self.resident.current
+        if idx is not None:
+            try:
+                with METRICS.timed("index_build_phase_seconds", phase="warmup"):
+                    warm_up(idx)
+            except Exception:
+                pass
+        self.warm = True
+        while True:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+                self._cond.wait_for(lambda: (self._dirty or self._full) and not self._holds)
+                self._busy = True
+            # let a burst of writes land before taking the batch
+            time.sleep(self.coalesce_s)
+            with self._cond:
+                dirty, full = self._dirty, self._full
+                self._dirty, self._full = set(), False
+            self._build(None if full else self.resident.get(), dirty)
+
+    def _build(self, base: Optional[Index], dirty: Optional[set[Path]]) -> None:
+        t0 = time.perf_counter()
+        kind, outcome = "noop", "ok"
+        try:
+            idx = base
+            # a batch this large (a bulk import) would be refit right after the upsert anyway
+            bulk = base is not None and len(dirty or ()) > DRIFT_THRESHOLD * len(base.chunks.note_paths)
+            if base is not None and base.chunks and dirty and not bulk:
+                kind = "incremental"
+                idx = replace(base)  # never mutate the snapshot readers hold
+                remove_notes(idx, [p for p in dirty if not p.is_file()])
+                upsert_notes(idx, [note_dict(p) for p in dirty if p.is_file()])
+            if bulk or idx is None or not idx.chunks or needs_refit(idx) or idx.profile != self.cfg.index_profile():
+                kind = "full"
+                idx = rebuild_on_disk(self.cfg)
+            elif idx is not base:
+                save_index(idx, self.cfg.index_path)
+            if idx is not base:
+                note_vectors(idx)  # here rather than in the first per-note search after publish
+                self.resident.publish(idx)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            outcome = "error"
+        METRICS.inc("index_builds_total", kind=kind, outcome=outcome)
+        if kind != "noop":
+            METRICS.observe("index_build_seconds", time.perf_counter() - t0, kind=kind)
+        with self._cond:
+            self.builds += 1
+            self.last_build_s = round(time.perf_counter() - t0, 4)
+            self.last_build_at = time.time()
+            self._cond.notify_all()
@@ -0,0 +1,55 @@
+from pathlib import Path
+import os
+
+import pytest
+
+import app.catalog as catalog_mod
+from app.catalog import Catalog
+from app.storage import save_new_note
+
+@pytest.fixture
+def notes(tmp_path):
+    d = tmp_path / "notes"
+    for i in range(3):
+        save_new_note(d, f"Note {i}", f"body {i}")
+    return d
+
+def test_sync_skips_symlinked_folder(tmp_path, notes):
+    (tmp_path / "elsewhere").mkdir()
+    os.symlink(tmp_path / "elsewhere", notes / "folder.md")
+    cat = Catalog(tmp_path / "catalog.sqlite3", notes)
+    changed, removed = cat.sync()
+    assert cat.ready.is_set()
+    assert len(changed) == 3 and removed == []
+    assert cat.count() == 3
+    assert cat.refresh([notes / "folder.md"]) == []
+
+def test_sync_survives_note_removed_during_scan(tmp_path, notes, monkeypatch):
+    cat = Catalog(tmp_path / "catalog.sqlite3", notes)
+    cat.sync()
+    gone = sorted(notes.rglob("*.md"))[0]
+    scan = catalog_mod.scan_notes
+    stamped = scan(notes)
+
+    def stale_scan(d: Path) -> dict:
+        # the note was there when scanned and is deleted before it is read
+        gone.unlink()
+        return {**stamped, str(gone): (0, 0)}
+
+    monkeypatch.setattr(catalog_mod, "scan_notes", stale_scan)
+    changed, removed = cat.sync()
+    assert cat.ready.is_set()
+    assert changed == [] and removed == [gone]
+    assert cat.get(gone) is None and cat.count() == 2
+    assert {r["path"] for r in cat.page(0, 10)} == set(stamped) - {str(gone)}
+
+def test_ready_is_set_when_sync_fails(tmp_path, notes, monkeypatch):
+    cat = Catalog(tmp_path / "catalog.sqlite3", notes)
+
+    def broken_scan(d: Path) -> dict:
+        raise RuntimeError("scan failed")
+
+    monkeypatch.setattr(catalog_mod, "scan_notes", broken_scan)
+    with pytest.raises(RuntimeError):
+        cat.sync()
+    assert cat.ready.is_set()
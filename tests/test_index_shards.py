@@ -0,0 +1,139 @@
+from pathlib import Path
+import json
+
+import numpy as np
+import pytest
+
+from app.indexer import (IndexProfile, RowBlocks, _date_rows, _shard_in_range, build_index, build_note_vectors,
+                         load_index, remove_notes, save_index, search, shard_key, upsert_notes)
+
+WORDS = "river delta zebra cache deploy garden lantern harbor violin quartz meadow copper".split()
+MONTHS = ("2024-01", "2024-02", "2024-03")
+
+def _note(i: int, created: str) -> dict:
+    body = " ".join(WORDS[(i + k) % len(WORDS)] for k in range(12)) + f" note{i}"
+    return {"id": f"n{i}", "path": f"/vault/{i}.md", "title": f"Note {i}", "created": created, "body": body}
+
+def _notes(per_month: int = 80) -> list:
+    notes = [_note(m * per_month + i, f"{month}-{1 + i % 28:02d}T08:00:00")
+             for m, month in enumerate(MONTHS) for i in range(per_month)]
+    return notes + [_note(10_000, ""), _note(10_001, "someday")]
+
+@pytest.fixture
+def saved(tmp_path):
+    idx = build_index(_notes(), IndexProfile(svd_dims=16))
+    save_index(idx, tmp_path / "index")
+    return tmp_path / "index", idx
+
+def _shard_dirs(path: Path) -> dict:
+    header = json.loads((path / (path / "CURRENT").read_text() / "header.json").read_text())
+    return {s["key"]: s["dir"] for s in header["shards"]}
+
+def _same(a, b) -> None:
+    assert list(a.chunks) == list(b.chunks)
+    assert [(s.key, s.start, s.end) for s in a.shards] == [(s.key, s.start, s.end) for s in b.shards]
+    np.testing.assert_allclose(np.asarray(a.matrix), np.asarray(b.matrix), rtol=1e-6)
+
+def test_save_load_round_trip(saved):
+    path, idx = saved
+    loaded = load_index(path)
+    _same(idx, loaded)
+    assert [s.key for s in loaded.shards] == list(MONTHS) + ["undated"]
+    for x, y in zip(search(idx, "zebra harbor", 8), search(loaded, "zebra harbor", 8)):
+        assert x[0] == y[0]
+
+def test_update_rewrites_only_dirty_shard(saved):
+    path, _ = saved
+    before = _shard_dirs(path)
+    idx = load_index(path)
+    remove_notes(idx, ["/vault/3.md"])
+    upsert_notes(idx, [_note(5, "2024-01-06T09:00:00")])
+    assert [s.key for s in idx.shards if s.dir is None] == ["2024-01"]
+    save_index(idx, path)
+    after = _shard_dirs(path)
+    assert after["2024-01"] != before["2024-01"]
+    assert {k: v for k, v in after.items() if k != "2024-01"} == {k: v for k, v in before.items() if k != "2024-01"}
+    assert sorted(str(p.relative_to(path)) for p in (path / "shards").iterdir()) == sorted(after.values())
+    _same(idx, load_index(path))
+
+def test_take_keeps_untouched_shards_as_views(saved):
+    path, _ = saved
+    idx = load_index(path)
+    mmaps = list(idx.matrix.parts)
+    feb = next(s for s in idx.shards if s.key == "2024-02")
+    remove_notes(idx, ["/vault/0.md", "/vault/1.md"])  # January loses two rows
+    assert isinstance(idx.matrix, RowBlocks)
+    views = [p for p in idx.matrix.parts if any(np.shares_memory(p, m) for m in mmaps)]
+    assert any(np.shares_memory(p, mmaps[1]) and len(p) == feb.end - feb.start for p in views)
+    # a short run is copied out
+    short = RowBlocks(mmaps).take([0, 1, 2])
+    assert not np.shares_memory(short.parts[0], mmaps[0])
+    np.testing.assert_array_equal(np.asarray(short), np.asarray(mmaps[0][:3]))
+
+def test_row_blocks_gather_and_slice():
+    a, b = np.arange(12.0).reshape(6, 2), np.arange(100.0, 108.0).reshape(4, 2)
+    rb = RowBlocks([a, b])
+    full = np.concatenate([a, b])
+    rows = [9, 0, 5, 6]
+    np.testing.assert_array_equal(rb[rows], full[rows])
+    np.testing.assert_array_equal(rb[4:8], full[4:8])
+    np.testing.assert_array_equal(np.asarray(rb.take(np.arange(10))), full)
+    assert len(rb.take([])) == 0
+
+def test_shard_key():
+    assert shard_key("2024-05-03T10:00:00", "month") == "2024-05"
+    assert shard_key("2024-05-03T10:00:00", "year") == "2024"
+    assert shard_key("2024-05-03T10:00:00", "none") == "all"
+    assert shard_key("", "month") == shard_key("someday", "year") == "undated"
+
+@pytest.mark.parametrize("key, date_from, date_to, expected", [
+    ("2024-03", "2024-03-15", None, True),
+    ("2024-03", "2024-04", None, False),
+    ("2024-12", None, "2024", True),         # partial date_to covers the whole year
+    ("2025-01", None, "2024", False),
+    ("2024-05", None, "2024-05-01", True),
+    ("2024", "2024-06", "2024-07", True),    # year shards
+    ("2024", "2025-01", None, False),
+    ("2024", None, "2023-12-31", False),
+    ("undated", "2030", "2031", False),     # undated notes are outside every range
+    ("all", "2030", None, True),
+])
+def test_shard_in_range(key, date_from, date_to, expected):
+    assert _shard_in_range(key, date_from, date_to) is expected
+
+def _created(idx, rows) -> set:
+    return {idx.chunks.note_created[j] for j in idx.chunks.chunk_note[rows].tolist()}
+
+def test_date_rows(saved):
+    _, idx = saved
+    assert _date_rows(idx, None, None) is None
+    rows = _date_rows(idx, "2024-02", "2024-02")
+    assert rows.size and all(c.startswith("2024-02") for c in _created(idx, rows))
+    rows = _date_rows(idx, None, "2024")
+    assert {c[:7] for c in _created(idx, rows)} == set(MONTHS)
+    rows = _date_rows(idx, "2024-03-10", None)
+    assert all(c >= "2024-03-10" for c in _created(idx, rows))
+    assert _date_rows(idx, "2030", None).size == 0
+    assert _date_rows(idx, "2000", None).size == len(idx.chunks) - 2  # not the two undated notes
+
+def test_date_rows_unsharded():
+    idx = build_index(_notes(10), IndexProfile(svd_dims=8, shard_by="none"))
+    assert [s.key for s in idx.shards] == ["all"]
+    assert _created(idx, _date_rows(idx, None, "2024-01")) == {f"2024-01-{d:02d}T08:00:00" for d in range(1, 11)}
+
+def test_date_rows_year_shards():
+    idx = build_index(_notes(10), IndexProfile(svd_dims=8, shard_by="year"))
+    assert [s.key for s in idx.shards] == ["2024", "undated"]
+    rows = _date_rows(idx, "2024-02-01", "2024-02")
+    assert rows.size and all(c.startswith("2024-02") for c in _created(idx, rows))
+
+def test_updates_keep_note_centroids(saved):
+    path, _ = saved
+    idx = load_index(path)
+    assert idx.notes is not None
+    remove_notes(idx, ["/vault/3.md", "/vault/90.md"])
+    upsert_notes(idx, [_note(5, "2024-03-06T09:00:00"), _note(20_000, "2024-02-01T10:00:00")])
+    assert idx.notes is not None
+    fresh = build_note_vectors(idx.chunks, idx.matrix)
+    np.testing.assert_allclose(idx.notes.centroids, fresh.centroids, atol=1e-5)
+    np.testing.assert_array_equal(idx.notes.order, fresh.order)
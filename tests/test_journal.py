@@ -0,0 +1,21 @@
+from app.journal import CaptureJournal
+from app.storage import load_note
+
+def test_capture_replays_after_crash(tmp_path):
+    notes_dir, log = tmp_path / "notes", tmp_path / "capture.journal"
+    body = "pasted\u2028from the web\u2029with\x85odd breaks\nand a normal one"
+    crashed = CaptureJournal(log, lambda paths: None, coalesce_s=3600)  # never gets to write the file
+    crashed.start()
+    note = crashed.capture(notes_dir, "Pasted", body)
+    with log.open("a", encoding="utf-8") as f:
+        f.write('{"path": "torn')  # crash mid-append
+
+    written = []
+    journal = CaptureJournal(log, written.extend, coalesce_s=3600)
+    journal.start()
+    assert journal.replayed == 1 and journal.is_pending(note.path)
+    assert journal.flush()
+    assert written == [note.path]
+    replayed = load_note(note.path)
+    assert replayed.body.rstrip("\n") == note.body.rstrip("\n")
+    assert replayed.meta.note_id == note.meta.note_id
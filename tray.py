@@ -1,13 +1,15 @@
-import threading
+import json
 import time
+import urllib.request
 import webbrowser
 from pathlib import Path
 
 import pystray
 from PIL import Image, ImageDraw
 
-from app.config import default_config
+from app.config import load_config
 from app.web import create_app
+from app.server import serve
 
 
 def _make_icon():
@@ -18,18 +20,26 @@ def _make_icon():
     return img
 
 
+def _wait_ready(url: str, timeout: float = 15.0) -> dict:
+    # Poll /healthz instead of sleeping a fixed time before offering the UI.
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + "/healthz", timeout=1) as resp:
+                return json.loads(resp.read().decode("utf-8"))
+        except OSError:
+            time.sleep(0.05)
+    return {}
+
+
 def main():
-    cfg = default_config(Path(__file__).resolve().parent)
+    cfg = load_config(Path(__file__).resolve().parent / "config.json")
     flask_app = create_app(cfg)
 
-    def run_server():
-        flask_app.run(host=cfg.host, port=cfg.port, debug=False, threaded=True)
-
-    t = threading.Thread(target=run_server, daemon=True)
-    t.start()
-    time.sleep(0.6)
+    server = serve(flask_app, cfg)
 
     url = f"http://{cfg.host}:{cfg.port}"
+    _wait_ready(url)
 
     # Define callbacks RIGHT HERE so they definitely exist before menu is built
     open_ui = lambda icon=None, item=None: webbrowser.open(url)
@@ -39,6 +49,8 @@ def main():
     copilot = lambda icon=None, item=None: webbrowser.open(url + "/copilot")
 
     def quit_app(icon, item):
+        # finish in-flight requests and write out journaled captures first
+        server.stop()
         icon.stop()
 
     menu = pystray.Menu(